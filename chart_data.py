@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 18:02:45 2026
+
+@author: stark
+"""
+
+"""Downsampled, cached plotly figures for the sales charts.
+
+A Daily chart of one dispensary has over a thousand points, more than the
+few hundred pixels of a chart column can show.  Series longer than the point
+budget are reduced with Largest-Triangle-Three-Buckets (Steinarsson, 2013):
+the first and last points are kept and every bucket in between contributes
+the point spanning the largest triangle with its neighbours, so peaks, dips
+and the shape of the trend survive.  The budget applies to the dates
+selected with the date range picker, so narrowing the range zooms into the
+full-resolution data; ranges shorter than the budget are not reduced.
+
+Built figures are kept in a small LRU cache keyed by (dispensary, channel,
+period, dates, ...) plus the modification time of the data they come from,
+so reruns with the same selection skip plotly.express entirely.  Cached
+figures are shared between sessions and must not be modified.
+"""
+import collections
+import os
+import threading
+
+import numpy as np
+
+POINT_BUDGET = int(os.environ.get("TDI_POINT_BUDGET", "500"))
+FIGURE_CACHE_SIZE = 256
+
+_figures = collections.OrderedDict()
+_figures_lock = threading.Lock()
+
+
+def lttb(x, y, threshold):
+    """Positions of the threshold points of (x, y) picked by LTTB, in order."""
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # bucket boundaries of the n - 2 points between the first and the last
+    edges = np.floor(np.linspace(1, n - 1, threshold - 1)).astype(np.int64)
+    picked = np.empty(threshold, dtype=np.int64)
+    picked[0], picked[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # the third corner is the average point of the next bucket
+        nxt_lo, nxt_hi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        cx, cy = x[nxt_lo:nxt_hi].mean(), y[nxt_lo:nxt_hi].mean()
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(area.argmax())
+        picked[i + 1] = a
+    return picked
+
+
+def downsample_frame(df, budget=POINT_BUDGET):
+    """Rows of a date-indexed frame kept by LTTB on each column, at most
+    budget per column.  The union of the rows is kept so the columns still
+    share their dates.
+    """
+    if budget is None or len(df) <= budget:
+        return df
+    x = df.index.values.astype('datetime64[ns]').astype(np.int64).astype(np.float64)
+    keep = np.zeros(len(df), dtype=bool)
+    for j in range(df.shape[1]):
+        values = df.iloc[:, j].to_numpy(dtype=np.float64)
+        valid = np.flatnonzero(np.isfinite(values))
+        keep[valid[lttb(x[valid], values[valid], budget)]] = True
+    return df[keep]
+
+
+def cached_figure(key, source, build):
+    """build(), reused while source (the data file the figure comes from)
+    is unchanged.  Keeps the FIGURE_CACHE_SIZE most recently used figures.
+    """
+    key = (key, source, os.stat(source).st_mtime_ns)
+    with _figures_lock:
+        if key in _figures:
+            _figures.move_to_end(key)
+            return _figures[key]
+    figure = build()
+    with _figures_lock:
+        _figures[key] = figure
+        _figures.move_to_end(key)
+        while len(_figures) > FIGURE_CACHE_SIZE:
+            _figures.popitem(last=False)
+    return figure
+
+
+def line_figure(df, title, x_title, y_title, budget=POINT_BUDGET):
+    """px.line of every column of a date-indexed frame, markers and lines,
+    downsampled to the point budget.
+    """
+    import plotly.express as px
+    df = downsample_frame(df, budget)
+    if df.shape[1] == 1:
+        fig = px.line(df, x=df.index, y=df.iloc[:, 0], title=title)
+    else:
+        fig = px.line(df, x=df.index, y=df.columns, title=title)
+    fig.update_traces(mode="markers+lines")
+    fig.update_xaxes(title=x_title)
+    fig.update_yaxes(title=y_title)
+    return fig
+
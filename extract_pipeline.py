@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 10:31:25 2026
+
+@author: stark
+"""
+
+"""Single-scan extraction of per-dispensary sales files from the raw LCB sales dump.
+
+pull_sales_data in the notebooks filtered the whole dask sales_df once per
+mme_id, so extracting N dispensaries meant N full scans of the dump.  Here the
+raw files are split into byte-range blocks (like dask's blocksize) and every
+block is read exactly once by a process pool.  Each worker groups its block by
+mme_id and appends the rows to its own part files; the parts are then
+concatenated per dispensary without re-parsing, in block order, into
+    sales_<mme_id>.csv          (default)
+    bucket_<n>.csv              (with buckets=n, rows hashed on mme_id)
+
+Blocks are cut on newlines, so rows must not contain embedded line breaks,
+which holds for the LCB exports.
+
+Usage:
+    python extract_pipeline.py "E:/TDI_Capstone_Data_Repo/Sales/*.csv" dispo_sales_data_repo --licensees Licensees_0.csv
+"""
+import argparse
+import glob
+import io
+import os
+import shutil
+import time
+import zlib
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+SALES_COLUMNS = ['global_id', 'created_at', 'updated_at', 'deleted_at',
+                 'type', 'sold_at', 'price_total', 'status']
+BLOCKSIZE = 64 * 2**20
+
+
+def dispensary_ids(licensees_path):
+    """mme_ids of every licensee of type 'dispensary'."""
+    lic_df = pd.read_csv(licensees_path)
+    return set(lic_df[lic_df['type'] == 'dispensary']['global_id'])
+
+
+def partition_name(mme_id, buckets=None):
+    if buckets:
+        return "bucket_{:03d}.csv".format(zlib.crc32(mme_id.encode()) % buckets)
+    return "sales_{}.csv".format(mme_id)
+
+
+def file_blocks(paths, blocksize=BLOCKSIZE):
+    """(path, start, end) byte ranges covering every file."""
+    blocks = []
+    for path in paths:
+        size = os.path.getsize(path)
+        for start in range(0, max(size, 1), blocksize):
+            blocks.append((path, start, min(start + blocksize, size)))
+    return blocks
+
+
+def read_block(path, start, end):
+    """Header line plus every line that starts inside [start, end)."""
+    with open(path, 'rb') as f:
+        header = f.readline()
+        if start <= len(header):
+            f.seek(len(header))
+        else:
+            # a line starting exactly at start is kept, a partial one is skipped
+            f.seek(start - 1)
+            f.readline()
+        data = f.read(max(0, end - f.tell()))
+        if data and not data.endswith(b'\n'):
+            data += f.readline()
+    return header, data
+
+
+def _extract_block(task):
+    """Worker: parse one block and append its rows to this block's part files."""
+    block_id, path, start, end, part_dir, sep, columns, mme_ids, buckets = task
+    header, data = read_block(path, start, end)
+    counts = Counter()
+    if not data:
+        return block_id, counts
+    df = pd.read_csv(io.BytesIO(header + data), sep=sep, usecols=columns + ['mme_id'],
+                     dtype=str, keep_default_na=False)
+    if mme_ids is not None:
+        df = df[df['mme_id'].isin(mme_ids)]
+    if df.empty:
+        return block_id, counts
+    counts.update(df['mme_id'].value_counts().to_dict())
+    names = {m: partition_name(m, buckets) for m in df['mme_id'].unique()}
+    # serialize the block once, grouped by output file, then slice its lines
+    df = df.assign(_part=df['mme_id'].map(names)).sort_values('_part', kind='stable')
+    lines = df[columns].to_csv(index=False, header=False).splitlines(keepends=True)
+    header_line = df[columns].head(0).to_csv(index=False)
+    parts = df['_part'].to_numpy()
+    bounds = [0] + [i for i in range(1, len(parts)) if parts[i] != parts[i - 1]] + [len(parts)]
+    out_dir = os.path.join(part_dir, "{:06d}".format(block_id))
+    os.makedirs(out_dir, exist_ok=True)
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        with open(os.path.join(out_dir, parts[lo]), 'w', newline='') as f:
+            f.write(header_line)
+            f.writelines(lines[lo:hi])
+    return block_id, counts
+
+
+def _merge_parts(part_dir, out_dir, n_blocks):
+    """Concatenates every block's part files, in block order, into out_dir."""
+    parts = {}
+    for block_id in range(n_blocks):
+        block_dir = os.path.join(part_dir, "{:06d}".format(block_id))
+        if os.path.isdir(block_dir):
+            for name in os.listdir(block_dir):
+                parts.setdefault(name, []).append(os.path.join(block_dir, name))
+    for name, paths in parts.items():
+        with open(os.path.join(out_dir, name), 'wb') as out:
+            for k, path in enumerate(paths):
+                with open(path, 'rb') as part:
+                    header = part.readline()
+                    if k == 0:
+                        out.write(header)
+                    shutil.copyfileobj(part, out)
+
+
+def extract_sales(raw_paths, out_dir, mme_ids=None, columns=SALES_COLUMNS, sep='\t',
+                  blocksize=BLOCKSIZE, buckets=None, workers=None):
+    """Splits the raw sales files into per-dispensary (or hash-bucketed) files
+    with one scan of the raw data.
+    Parameters
+    ----------
+    raw_paths:
+        raw LCB sales files.
+    out_dir:
+        directory receiving sales_<mme_id>.csv / bucket_<n>.csv.
+    mme_ids:
+        only keep these dispensaries, defaults to every mme_id in the dump.
+    buckets:
+        hash rows into this many files instead of one file per dispensary.
+    workers:
+        size of the process pool, defaults to the number of cores.
+    Returns the number of rows written per mme_id.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    part_dir = os.path.join(out_dir, "_parts")
+    if os.path.isdir(part_dir):
+        shutil.rmtree(part_dir)
+    mme_ids = None if mme_ids is None else frozenset(mme_ids)
+    blocks = file_blocks(sorted(raw_paths), blocksize)
+    tasks = [(i, path, start, end, part_dir, sep, list(columns), mme_ids, buckets)
+             for i, (path, start, end) in enumerate(blocks)]
+    totals = Counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # the parts are merged by block id, so blocks are taken as they finish
+        for future in as_completed([pool.submit(_extract_block, task) for task in tasks]):
+            _, counts = future.result()
+            totals.update(counts)
+    _merge_parts(part_dir, out_dir, len(blocks))
+    shutil.rmtree(part_dir)
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract per-dispensary sales files from the raw LCB dump in one scan.")
+    parser.add_argument("raw", help="glob of the raw sales files")
+    parser.add_argument("out_dir")
+    parser.add_argument("--licensees", help="only extract dispensaries listed in this Licensees_0.csv")
+    parser.add_argument("--sep", default='\t')
+    parser.add_argument("--blocksize", type=int, default=BLOCKSIZE)
+    parser.add_argument("--buckets", type=int)
+    parser.add_argument("--workers", type=int)
+    args = parser.parse_args()
+    mme_ids = dispensary_ids(args.licensees) if args.licensees else None
+    t0 = time.time()
+    totals = extract_sales(glob.glob(args.raw), args.out_dir, mme_ids=mme_ids, sep=args.sep,
+                           blocksize=args.blocksize, buckets=args.buckets, workers=args.workers)
+    print("Extracted {:,} rows for {} dispensaries in {:.1f}s".format(sum(totals.values()), len(totals),
+                                                                    time.time() - t0))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 15:03:51 2026
+
+@author: stark
+"""
+
+"""Cached, rate-limited batch geocoding of the dispensaries in Licensees_0.csv.
+
+dispensary_info.csv used to be built by sending every address to geopy one
+request at a time and patching the misses by hand in manual_geo_fix_help.csv,
+so every re-run repeated every lookup.  Here every lookup ends up in a SQLite
+cache keyed on the normalized address1 / city / postal_code, so a licensee is
+only geocoded when it is new or its address changed.  Addresses are resolved
+in this order:
+    overrides   Lat/Lon entered by hand in manual_geo_fix_help.csv (or --overrides)
+    cache       earlier results, including addresses the backend could not find
+    backend     the rest, on a bounded thread pool sharing one rate limiter
+On the first run the cache is seeded from the Lat/Lon already in
+dispensary_info.csv, so the existing coordinates are never looked up again.
+Results outside of Washington are rejected, they are always a wrong match.
+
+The backend is anything with a geocode(query) method returning
+(lat, lon, address) or None: NominatimBackend wraps geopy, StubBackend answers
+from a table or a deterministic point in the state, without any network.
+    python geocoding.py [--backend nominatim|stub] [--workers 2] [--rate 1.0]
+"""
+import argparse
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+LICENSEES_FILE = "Licensees_0.csv"
+OVERRIDES_FILE = "manual_geo_fix_help.csv"
+INFO_FILE = "dispensary_info.csv"
+CACHE_FILE = "geocode_cache.sqlite"
+USER_AGENT = "tdi_capstone_dispensaries"
+WORKERS = 2
+# Nominatim's usage policy allows at most one request per second
+RATE = 1.0
+RETRIES = 3
+# (south, north, west, east), anything outside is a wrong match
+WA_BOUNDS = (45.5, 49.1, -124.9, -116.9)
+
+
+def normalize_address(address1, city, postal_code):
+    """Cache key of an address: upper case words without punctuation and the
+    5 digit zip code, 'ADDRESS|CITY|ZIP'.
+    """
+    def _words(value):
+        if not isinstance(value, str):
+            return ""
+        return " ".join(re.sub(r"[^0-9A-Z ]", " ", value.upper().replace("'", "")).split())
+    digits = re.sub(r"\D", "", postal_code) if isinstance(postal_code, str) else ""
+    return "|".join([_words(address1), _words(city), digits[:5]])
+
+
+def address_keys(df):
+    """normalize_address of every row of a licensee table."""
+    return pd.Series([normalize_address(a, c, p) for a, c, p in
+                      zip(df['address1'], df['city'], df['postal_code'])], index=df.index)
+
+
+def address_queries(row):
+    """Queries to try for one licensee, most specific first."""
+    street, city = row['address1'], row['city']
+    zip5 = str(row['postal_code'])[:5] if isinstance(row['postal_code'], str) else ""
+    return ["{}, {}, WA {}".format(street, city, zip5).strip(),
+            "{} {}".format(street, city)]
+
+
+def in_washington(lat, lon):
+    south, north, west, east = WA_BOUNDS
+    return south <= lat <= north and west <= lon <= east
+
+
+class GeocodeCache:
+    """SQLite table of geocoded addresses, keyed by normalize_address.
+    A NULL lat/lon records an address the backend could not find, so it is
+    not looked up again unless retried explicitly.
+    """
+    def __init__(self, path=CACHE_FILE):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS geocodes (
+                             key TEXT PRIMARY KEY, lat REAL, lon REAL,
+                             address TEXT, source TEXT, updated_at TEXT)""")
+        self.conn.commit()
+
+    def get_many(self, keys):
+        """{key: (lat, lon, address)} of the cached keys."""
+        found = {}
+        keys = list(keys)
+        for i in range(0, len(keys), 500):
+            part = keys[i:i + 500]
+            rows = self.conn.execute("SELECT key, lat, lon, address FROM geocodes WHERE key IN ({})"
+                                     .format(",".join("?" * len(part))), part)
+            for key, lat, lon, address in rows:
+                found[key] = (lat, lon, address)
+        return found
+
+    def put(self, key, result, source, commit=True):
+        lat, lon, address = result if result is not None else (None, None, None)
+        self.conn.execute("INSERT OR REPLACE INTO geocodes VALUES (?, ?, ?, ?, ?, ?)",
+                          (key, lat, lon, address, source, time.strftime("%Y-%m-%d %H:%M:%S")))
+        if commit:
+            self.conn.commit()
+
+    def seed(self, info_path):
+        """Adds the coordinates already in a dispensary_info.csv for addresses
+        the cache does not have yet.  Returns the number added.
+        """
+        info = pd.read_csv(info_path, dtype=str)
+        lat = pd.to_numeric(info['Lat'], errors='coerce')
+        lon = pd.to_numeric(info['Lon'], errors='coerce')
+        # earlier matches outside of the state are looked up again
+        info = info[[in_washington(a, b) for a, b in zip(lat, lon)]]
+        keys = address_keys(info)
+        cached = self.get_many(keys.unique())
+        added = 0
+        for key, (_, row) in zip(keys, info.iterrows()):
+            if key in cached:
+                continue
+            cached[key] = None
+            self.put(key, (float(row['Lat']), float(row['Lon']), row.get('main-address')), 'seed',
+                     commit=False)
+            added += 1
+        self.conn.commit()
+        return added
+
+    def close(self):
+        self.conn.close()
+
+
+def load_overrides(path=OVERRIDES_FILE):
+    """{address key: (lat, lon, None)} of the rows of a hand-fixed licensee
+    table whose Lat/Lon were entered by hand.  The sheet also carries the
+    geocoder's own results, which have a main-address; those are not
+    overrides.  Overrides outside of Washington are reported and dropped.
+    """
+    if path is None or not os.path.exists(path):
+        return {}
+    df = pd.read_csv(path, dtype=str)
+    lat = pd.to_numeric(df['Lat'], errors='coerce')
+    lon = pd.to_numeric(df['Lon'], errors='coerce')
+    by_hand = lat.notna() & lon.notna()
+    if 'main-address' in df:
+        by_hand &= df['main-address'].isna()
+    df = df[by_hand]
+    overrides = {}
+    for key, i in zip(address_keys(df), df.index):
+        if not in_washington(lat[i], lon[i]):
+            print("!! override {} ({}, {}) is outside of Washington, ignored".format(
+                df.at[i, 'global_id'] if 'global_id' in df else key, lat[i], lon[i]))
+            continue
+        overrides[key] = (lat[i], lon[i], None)
+    return overrides
+
+
+class RateLimiter:
+    """Spaces calls at least 1 / rate seconds apart across all threads."""
+    def __init__(self, rate=RATE):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class NominatimBackend:
+    """geopy's Nominatim geocoder (OpenStreetMap)."""
+    def __init__(self, user_agent=USER_AGENT, timeout=10):
+        # geopy is only needed to build dispensary_info.csv, not to run the app
+        from geopy.geocoders import Nominatim
+        self.geolocator = Nominatim(user_agent=user_agent, timeout=timeout)
+
+    def geocode(self, query):
+        location = self.geolocator.geocode(query, country_codes='us')
+        if location is None:
+            return None
+        return location.latitude, location.longitude, location.address
+
+
+class StubBackend:
+    """Offline backend for tests: answers from a {query: (lat, lon, address)}
+    table, or with a point in Washington derived from the query's hash.
+    """
+    def __init__(self, table=None):
+        self.table = table
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def geocode(self, query):
+        with self._lock:
+            self.calls += 1
+        if self.table is not None:
+            return self.table.get(query)
+        digest = hashlib.md5(query.encode('utf-8')).digest()
+        south, north, west, east = WA_BOUNDS
+        lat = south + (north - south) * digest[0] / 255
+        lon = west + (east - west) * digest[1] / 255
+        return lat, lon, query
+
+
+def make_backend(name):
+    if name == 'stub':
+        return StubBackend()
+    return NominatimBackend()
+
+
+def lookup(backend, limiter, queries, retries=RETRIES):
+    """First in-state result of the queries, None if there is none.
+    Raises the backend's error when it keeps failing, so the address is
+    retried on the next run instead of cached as not found.
+    """
+    for query in queries:
+        for attempt in range(retries):
+            limiter.wait()
+            try:
+                result = backend.geocode(query)
+                break
+            except Exception:
+                if attempt == retries - 1:
+                    raise
+                time.sleep(2 ** attempt)
+        if result is not None and in_washington(result[0], result[1]):
+            return result
+    return None
+
+
+def geocode_addresses(queries, backend, cache, workers=WORKERS, rate=RATE):
+    """Geocodes {key: queries} on a pool of workers sharing one rate limiter
+    and stores every result in the cache as it arrives.
+    Returns (found, missing, errors) counts.
+    """
+    limiter = RateLimiter(rate)
+    counts = {'found': 0, 'missing': 0, 'errors': 0}
+
+    def _task(item):
+        key, key_queries = item
+        try:
+            return key, lookup(backend, limiter, key_queries), None
+        except Exception as err:
+            return key, None, err
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for key, result, err in pool.map(_task, queries.items()):
+            if err is not None:
+                counts['errors'] += 1
+                print("!! {}: {}".format(key, err))
+                continue
+            cache.put(key, result, type(backend).__name__)
+            counts['found' if result is not None else 'missing'] += 1
+    return counts['found'], counts['missing'], counts['errors']
+
+
+def geocode_licensees(licensees_path=LICENSEES_FILE, out_path=INFO_FILE, cache_path=CACHE_FILE,
+                      overrides_path=OVERRIDES_FILE, backend='nominatim', workers=WORKERS, rate=RATE,
+                      retry_failed=False):
+    """Writes the geocoded dispensaries of a licensee table to out_path,
+    looking up only the addresses that are neither overridden nor cached.
+    backend is a backend or the name of one, only created if needed.
+    Returns the written table.
+    """
+    licensees = pd.read_csv(licensees_path, dtype=str, encoding='utf-8-sig')
+    df = licensees[licensees['type'] == 'dispensary'].copy()
+    keys = address_keys(df)
+    overrides = load_overrides(overrides_path)
+    cache = GeocodeCache(cache_path)
+    try:
+        if os.path.exists(out_path):
+            seeded = cache.seed(out_path)
+            if seeded:
+                print("Seeded the cache with {} addresses from {}".format(seeded, out_path))
+        wanted = [key for key in keys.unique() if key not in overrides]
+        cached = cache.get_many(wanted)
+        if retry_failed:
+            cached = {key: value for key, value in cached.items() if value[0] is not None}
+        queries = {}
+        for key, (_, row) in zip(keys, df.iterrows()):
+            if key not in overrides and key not in cached and key not in queries and key.split("|")[0]:
+                queries[key] = address_queries(row)
+        print("{} dispensaries, {} overridden, {} cached, {} to geocode".format(
+            len(df), int(keys.isin(list(overrides)).sum()), len(cached), len(queries)))
+        if queries:
+            if isinstance(backend, str):
+                backend = make_backend(backend)
+            found, missing, errors = geocode_addresses(queries, backend, cache, workers, rate)
+            print("Geocoded {} addresses, {} not found, {} failed".format(found, missing, errors))
+        results = cache.get_many(wanted)
+    finally:
+        cache.close()
+    results.update(overrides)
+    located = [results.get(key, (None, None, None)) for key in keys]
+    df['Full_Address'] = df['address1'] + " " + df['city']
+    df['main-address'] = [address for _, _, address in located]
+    df['Lat'] = np.array([np.nan if lat is None else lat for lat, _, _ in located], dtype=np.float64)
+    df['Lon'] = np.array([np.nan if lon is None else lon for _, lon, _ in located], dtype=np.float64)
+    df.to_csv(out_path)
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Geocode the dispensaries of a licensee table into dispensary_info.csv.")
+    parser.add_argument("--licensees", default=LICENSEES_FILE)
+    parser.add_argument("--out", default=INFO_FILE)
+    parser.add_argument("--cache", default=CACHE_FILE)
+    parser.add_argument("--overrides", default=OVERRIDES_FILE)
+    parser.add_argument("--backend", choices=['nominatim', 'stub'], default='nominatim')
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--rate", type=float, default=RATE, help="requests per second")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="look up the addresses cached as not found again")
+    args = parser.parse_args()
+    t0 = time.time()
+    df = geocode_licensees(args.licensees, args.out, args.cache, args.overrides,
+                           args.backend, args.workers, args.rate, args.retry_failed)
+    print("Wrote {} ({} located) in {:.1f}s".format(args.out, int(df['Lat'].notna().sum()),
+                                                     time.time() - t0))
+
+
+if __name__ == "__main__":
+    main()
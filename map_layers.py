@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 09:52:07 2026
+
+@author: stark
+"""
+
+"""Batched folium layers for the dispensary maps.
+
+Instead of one folium.Marker per dispensary (each rendered through its own
+template, icon and popup), all peer dispensaries are written into a single
+JSON array that the browser turns into markers.  The array for the statewide
+layer is serialized once per process and reused for every selection; the
+selected dispensary is skipped in the browser rather than removed from it, so
+only the highlighted marker differs between reruns.
+"""
+import json
+
+import folium
+from branca.element import MacroElement
+from folium.elements import JSCSSMixin
+from jinja2 import Template
+
+from sales_data import cached_load
+
+
+def marker_payload(df):
+    """JSON array of [lat, lon, name, global_id] rows, built from whole columns."""
+    df = df[df['Lat'].notna() & df['Lon'].notna()]
+    rows = zip(df['Lat'].tolist(), df['Lon'].tolist(),
+               df['name'].astype(str).str.rstrip().tolist(), df['global_id'].tolist())
+    # escape '</' so a name can never close the surrounding <script> tag
+    return json.dumps([list(row) for row in rows]).replace('</', '<\\/')
+
+
+def cached_markerPayload(df, filename, key):
+    """marker_payload(df), kept for the life of filename under key.
+    Only meant for a handful of fixed layers such as the whole state.
+    """
+    def _build(path):
+        return marker_payload(df)
+    return cached_load(filename, _build, key=key)
+
+
+class DispensaryMarkers(JSCSSMixin, MacroElement):
+    """Red markers for a group of dispensaries, drawn in the browser from one JSON array.
+    Parameters
+    ----------
+    payload:
+        output of marker_payload().
+    skip:
+        global_id left off the layer, e.g. the highlighted dispensary.
+    cluster:
+        group nearby markers with Leaflet.markercluster.
+    """
+    _template = Template(u"""
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = (function(){
+                var data = {{ this.payload }};
+                var skip = {{ this.skip|tojson }};
+                {%- if this.cluster %}
+                var layer = L.markerClusterGroup();
+                {%- else %}
+                var layer = L.featureGroup();
+                {%- endif %}
+                for (var i = 0; i < data.length; i++) {
+                    var row = data[i];
+                    if (row[3] === skip) { continue; }
+                    var popup = document.createElement('div');
+                    popup.textContent = row[2];
+                    var marker = L.marker(new L.LatLng(row[0], row[1]));
+                    marker.setIcon(L.AwesomeMarkers.icon(
+                        {markerColor: 'red', icon: 'info-sign', prefix: 'glyphicon'}));
+                    marker.bindPopup(popup);
+                    layer.addLayer(marker);
+                }
+                layer.addTo({{ this._parent.get_name() }});
+                return layer;
+            })();
+        {% endmacro %}""")
+
+    default_js = [
+        ('markerclusterjs', "https://cdnjs.cloudflare.com/ajax/libs/leaflet.markercluster/1.1.0/leaflet.markercluster.js"),
+    ]
+    default_css = [
+        ('markerclustercss', "https://cdnjs.cloudflare.com/ajax/libs/leaflet.markercluster/1.1.0/MarkerCluster.css"),
+        ('markerclusterdefaultcss', "https://cdnjs.cloudflare.com/ajax/libs/leaflet.markercluster/1.1.0/MarkerCluster.Default.css"),
+    ]
+
+    def __init__(self, payload, skip=None, cluster=True):
+        super().__init__()
+        self._name = 'DispensaryMarkers'
+        self.payload = payload
+        self.skip = skip
+        self.cluster = cluster
+
+
+def dispensary_map(selected_dispo, company, payload, zoom_start=10, skip=None, cluster=True):
+    """folium map centered on the selected dispensary (blue marker) with
+    every dispensary in payload drawn as a red marker.
+    """
+    location = [float(selected_dispo['Lat'].iloc[0]), float(selected_dispo['Lon'].iloc[0])]
+    m = folium.Map(location=location, zoom_start=zoom_start)
+    DispensaryMarkers(payload, skip=skip, cluster=cluster).add_to(m)
+    # keep the highlighted marker drawn above the layer
+    folium.Marker(location, popup=company, tooltip=company, z_index_offset=1000).add_to(m)
+    return m
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 16:31:40 2026
+
+@author: stark
+"""
+
+"""Timing and memory instrumentation of the page runs of MultiApp.
+
+MultiApp times every page run when instrumentation is on (TDI_METRICS=1 or
+MultiApp(instrument=True)).  Inside a page, stage(name) marks the end of a
+named stage: it records the time and the change in resident memory since the
+page started or since the previous stage, e.g.
+    license_df = get_licenseInfo(license_info)
+    stage("load")
+    ...
+    st.plotly_chart(f)
+    stage("charts")
+Each completed run is written as one JSON line to the "page_metrics" logger
+(stderr, or the file named by TDI_METRICS_LOG) and added to a rolling window
+of the last WINDOW runs of its page, shared by every session of the process,
+from which latency_summary() gives the p50/p95 of every page and stage.
+With TDI_DEBUG_PANEL=1 the sidebar shows the last run, the rolling latencies
+and the sales_data cache counters.
+
+When instrumentation is off no run is active and stage() returns after one
+attribute lookup.  Memory is the resident set size of the whole process, so
+the deltas of concurrent sessions overlap; they show which stage allocates,
+not an exact figure.
+"""
+import collections
+import json
+import logging
+import os
+import threading
+import time
+
+import streamlit as st
+
+ENABLED = os.environ.get("TDI_METRICS", "0") not in ("", "0")
+DEBUG_PANEL = os.environ.get("TDI_DEBUG_PANEL", "0") not in ("", "0")
+LOG_FILE = os.environ.get("TDI_METRICS_LOG")
+WINDOW = 200
+
+logger = logging.getLogger("page_metrics")
+_local = threading.local()
+_history = {}
+_history_lock = threading.Lock()
+
+
+def rss_mb():
+    """Resident set size of the process in MB, 0 where /proc is not available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+
+def _configure_log():
+    if logger.handlers:
+        return
+    handler = logging.FileHandler(LOG_FILE) if LOG_FILE else logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+class PageRun:
+    """Timings of one run of a page and of the stages marked inside it."""
+    def __init__(self, page):
+        self.page = page
+        self.stages = []
+        self.seconds = None
+        self.rss_delta_mb = None
+        self._t0 = self._last = time.perf_counter()
+        self._rss0 = self._last_rss = rss_mb()
+
+    def lap(self, name):
+        now, rss = time.perf_counter(), rss_mb()
+        self.stages.append({'stage': name, 'seconds': now - self._last,
+                            'rss_delta_mb': rss - self._last_rss})
+        self._last, self._last_rss = now, rss
+
+    def finish(self):
+        now, rss = time.perf_counter(), rss_mb()
+        if self.stages and now - self._last > 0:
+            # whatever ran after the last marked stage
+            self.stages.append({'stage': 'rest', 'seconds': now - self._last,
+                                'rss_delta_mb': rss - self._last_rss})
+        self.seconds = now - self._t0
+        self.rss_delta_mb = rss - self._rss0
+
+    def record(self):
+        return {'event': 'page_run', 'time': time.strftime("%Y-%m-%dT%H:%M:%S"), 'page': self.page,
+                'seconds': round(self.seconds, 6), 'rss_delta_mb': round(self.rss_delta_mb, 3),
+                'stages': [{'stage': s['stage'], 'seconds': round(s['seconds'], 6),
+                            'rss_delta_mb': round(s['rss_delta_mb'], 3)} for s in self.stages]}
+
+
+def _remember(key, seconds):
+    with _history_lock:
+        window = _history.get(key)
+        if window is None:
+            window = _history[key] = collections.deque(maxlen=WINDOW)
+        window.append(seconds)
+
+
+def start_run(page):
+    """Starts timing a run of page in the current session's thread."""
+    _configure_log()
+    _local.run = PageRun(page)
+    return _local.run
+
+
+def end_run(completed=True):
+    """Stops the current run; a completed run is logged and added to the
+    rolling latencies, an interrupted one (e.g. a widget rerun) is dropped.
+    """
+    run = getattr(_local, 'run', None)
+    _local.run = None
+    if run is None or not completed:
+        return None
+    run.finish()
+    _remember((run.page, None), run.seconds)
+    for s in run.stages:
+        _remember((run.page, s['stage']), s['seconds'])
+    logger.info(json.dumps(run.record()))
+    return run
+
+
+def log_event(event, **fields):
+    """Logs a one-off event, e.g. the startup time, as a JSON line."""
+    _configure_log()
+    record = {'event': event, 'time': time.strftime("%Y-%m-%dT%H:%M:%S")}
+    record.update(fields)
+    logger.info(json.dumps(record))
+
+
+def stage(name):
+    """Marks the end of stage name of the running page, no-op when not instrumented."""
+    run = getattr(_local, 'run', None)
+    if run is not None:
+        run.lap(name)
+
+
+def _quantile(values, q):
+    values = sorted(values)
+    position = q * (len(values) - 1)
+    lo = int(position)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (position - lo)
+
+
+def latency_summary():
+    """Rolling runs/p50/p95 (seconds) of every page, listed as stage '(page)',
+    and of every stage marked in it.
+    """
+    with _history_lock:
+        windows = {key: list(window) for key, window in _history.items()}
+    return [{'page': page, 'stage': name or '(page)', 'runs': len(values),
+             'p50': _quantile(values, 0.5), 'p95': _quantile(values, 0.95)}
+            for (page, name), values in sorted(windows.items(), key=lambda kv: (kv[0][0], kv[0][1] or ''))]
+
+
+def debug_panel(run, startup=None):
+    """Sidebar panel with the last run, the rolling latencies and cache counters."""
+    from sales_data import cache_info
+    st.sidebar.subheader("Performance")
+    if startup is not None:
+        st.sidebar.write("First render: {:.3f}s after startup".format(startup))
+    if run is not None:
+        st.sidebar.write("{0}: {1:.3f}s, {2:+.1f} MB".format(run.page, run.seconds, run.rss_delta_mb))
+    if run is not None and run.stages:
+        st.sidebar.table([{'stage': s['stage'], 'seconds': round(s['seconds'], 3),
+                           'MB': round(s['rss_delta_mb'], 1)} for s in run.stages])
+    st.sidebar.table([{'page': r['page'], 'stage': r['stage'], 'runs': r['runs'],
+                       'p50': round(r['p50'], 3), 'p95': round(r['p95'], 3)} for r in latency_summary()])
+    st.sidebar.write("Cache: {}".format(cache_info()))
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 08:40:53 2026
+
+@author: stark
+"""
+
+"""Vectorized peer comparison of every dispensary against the rest of the state.
+
+For one channel and period, PeerStats makes a single NumPy pass over the
+rollup matrix and computes, for every dispensary at once:
+    total               total sales over its active span
+    average             average sales per period over its active span
+    total_pct_diff      % difference of total vs. the mean of all other dispensaries
+    average_pct_diff    % difference of average vs. the mean of all other dispensaries
+    total_percentile    % of dispensaries with total sales at or below it
+    average_percentile  % of dispensaries with average sales at or below it
+The state-wide sum of every bin is kept as well, so the mean of the other
+dispensaries in a bin is (state - own) / (n - 1) without touching their
+columns.  Results are cached per channel/period, so a comparison against the
+state is a table lookup no matter how many dispensaries are loaded.
+"""
+import numpy as np
+import pandas as pd
+
+from sales_data import cached_load
+from sales_store import STORE_DIR, get_salesCompanies
+from sales_rollups import get_rollup, load_rollupArrays, rollup_source
+
+
+def _percentile(x):
+    ordered = np.sort(x)
+    return np.searchsorted(ordered, x, side='right') / len(x) * 100
+
+
+def _pct_diff(x):
+    """% difference of every entry vs. the mean of all the other entries."""
+    n = len(x)
+    if n < 2:
+        return np.full(n, np.nan)
+    others = (x.sum() - x) / (n - 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (x - others) / others * 100
+
+
+class PeerStats:
+    """State-wide comparison table for one channel and period.
+    Parameters
+    ----------
+    channel:
+        'total', 'medical' or 'recreational'.
+    period:
+        'Daily', 'Weekly', 'Monthly', 'Quarterly' or 'Yearly'.
+    global_ids:
+        dispensaries that make up the state, defaults to every dispensary
+        in total_sales.csv.
+    """
+    def __init__(self, channel, period, global_ids=None, store_dir=STORE_DIR):
+        self.channel = channel
+        self.period = period
+        self.store_dir = store_dir
+        if global_ids is None:
+            global_ids = get_salesCompanies("total_sales.csv", store_dir)
+        self.columns = pd.Index(global_ids)
+        dates, columns, values, spans = load_rollupArrays(channel, period, store_dir)
+        # dispensaries without a column in this channel have no sales in it
+        lookup = {c: j for j, c in enumerate(columns)}
+        positions = np.array([lookup.get(c, -1) for c in self.columns])
+        present = positions >= 0
+        matrix = np.zeros((len(dates), len(self.columns)))
+        matrix[:, present] = values[:, positions[present]]
+        n_bins = np.zeros(len(self.columns), dtype=np.int64)
+        n_bins[present] = spans[positions[present], 1] - spans[positions[present], 0]
+        # values outside a dispensary's span are zero, so plain sums are span sums
+        totals = matrix.sum(axis=0)
+        averages = np.divide(totals, n_bins, out=np.zeros_like(totals), where=n_bins > 0)
+        self.state_bins = pd.Series(matrix.sum(axis=1), index=dates)
+        self.table = pd.DataFrame({
+            'total': totals,
+            'average': averages,
+            'bins': n_bins,
+            'total_pct_diff': _pct_diff(totals),
+            'average_pct_diff': _pct_diff(averages),
+            'total_percentile': _percentile(totals),
+            'average_percentile': _percentile(averages),
+            }, index=self.columns)
+
+    def __len__(self):
+        return len(self.columns)
+
+    def summary(self, global_id):
+        """Row of the comparison table for one dispensary."""
+        return self.table.loc[global_id]
+
+    def peer_average_total(self, global_id):
+        """Mean total sales of all the other dispensaries."""
+        totals = self.table['total']
+        return (totals.sum() - totals[global_id]) / (len(self) - 1)
+
+    def peer_mean(self, global_id):
+        """Mean sales of all the other dispensaries in every bin of global_id's span."""
+        own = get_rollup(self.channel, self.period, global_id, self.store_dir)[global_id]
+        state = self.state_bins.reindex(own.index, fill_value=0.0)
+        return (state - own) / (len(self) - 1)
+
+
+def peer_stats(channel, period, store_dir=STORE_DIR):
+    """Shared PeerStats, rebuilt when the underlying rollup changes."""
+    def _build(path):
+        return PeerStats(channel, period, store_dir=store_dir)
+    return cached_load(rollup_source(channel, period, store_dir), _build,
+                       key=(channel, period, store_dir))
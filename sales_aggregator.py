@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 11:18:44 2026
+
+@author: stark
+"""
+
+"""Streaming, parallel rebuild of the nine wide daily sales matrices.
+
+sales_stats in Further_Cannabis_Analysis.ipynb loaded every per-dispensary
+file whole, fixed returns with a row-wise apply and ran a separate query +
+resample for every statistic.  Here every file is read in chunks and each
+chunk is reduced to per (day, type) count / sum / M2 (sum of squared
+deviations from the mean) with one groupby.  Those partial statistics merge
+exactly (Chan et al.'s parallel form of Welford's algorithm), so the chunks
+of a file, and the types making up the 'total' channel, are combined without
+ever holding the raw rows.  Memory per worker is bounded by the chunk size
+and the number of days, not by the length of a dispensary's history.
+
+The outputs match sales_stats:
+    <channel>_sales.csv         daily sum of price_total, 0 on days without sales
+    <channel>_salesAverage.csv  daily mean price_total
+    <channel>_salesStddev.csv   daily sample standard deviation of price_total
+for the channels total (every 'sale'), medical ('retail_medical' sales) and
+recreational ('retail_recreational' sales).  Each dispensary's series spans
+its first to last day with sales in that channel, NaN outside of it.
+
+Usage:
+    python sales_aggregator.py dispo_sales_data_repo --out-dir . --workers 4
+"""
+import argparse
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+CHANNEL_TYPES = {'medical': 'retail_medical',
+                 'recreational': 'retail_recreational'}
+STAT_SUFFIXES = {'sum': '_sales', 'mean': '_salesAverage', 'std': '_salesStddev'}
+FILE_PATTERN = re.compile(r"(?<=sales_)(WAWA1\.[A-Z0-9]+)")
+CHUNKSIZE = 500000
+
+
+def merge_moments(a, b):
+    """Merges two frames of count/sum/m2 moments aligned on their index."""
+    a, b = a.align(b, fill_value=0)
+    n = a['count'] + b['count']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        delta = b['sum'] / b['count'] - a['sum'] / a['count']
+        cross = (delta**2 * a['count'] * b['count'] / n).where((a['count'] > 0) & (b['count'] > 0), 0.0)
+    return pd.DataFrame({'count': n, 'sum': a['sum'] + b['sum'], 'm2': a['m2'] + b['m2'] + cross})
+
+
+def chunk_moments(chunk):
+    """count/sum/m2 of price_total per (type, day) of the 'sale' rows of one chunk."""
+    sales = chunk[chunk['status'] == 'sale']
+    price = sales['price_total'].abs()
+    keys = [sales['type'], pd.to_datetime(sales['sold_at']).dt.normalize().rename('sold_at')]
+    grouped = price.groupby(keys)
+    count = grouped.count()
+    var = grouped.var(ddof=0).fillna(0.0)
+    return pd.DataFrame({'count': count, 'sum': grouped.sum(), 'm2': var * count})
+
+
+def file_moments(path, chunksize=CHUNKSIZE):
+    """Moments per (type, day) of one per-dispensary sales file, read in chunks."""
+    moments = None
+    reader = pd.read_csv(path, usecols=['type', 'sold_at', 'price_total', 'status'],
+                         chunksize=chunksize)
+    for chunk in reader:
+        chunk['price_total'] = pd.to_numeric(chunk['price_total'], errors='coerce')
+        part = chunk_moments(chunk)
+        moments = part if moments is None else merge_moments(moments, part)
+    return moments
+
+
+def daily_stats(moments):
+    """Daily sum/mean/std over the first to last day with sales, like resample('D')."""
+    moments = moments[moments['count'] > 0].sort_index()
+    if moments.empty:
+        return pd.DataFrame(columns=['sum', 'mean', 'std'], dtype=float,
+                            index=pd.DatetimeIndex([], name='sold_at'))
+    days = pd.date_range(moments.index.min(), moments.index.max(), freq='D', name='sold_at')
+    moments = moments.reindex(days, fill_value=0)
+    n = moments['count']
+    return pd.DataFrame({'sum': moments['sum'],
+                         'mean': (moments['sum'] / n).where(n > 0),
+                         'std': np.sqrt(moments['m2'] / (n - 1)).where(n > 1)})
+
+
+def channel_moments(moments):
+    """{channel: moments per day} from the moments per (type, day) of one dispensary."""
+    if moments is None:
+        moments = pd.DataFrame(columns=['count', 'sum', 'm2'], dtype=float,
+                               index=pd.MultiIndex.from_arrays([[], []], names=['type', 'sold_at']))
+    channels = {}
+    # the total channel is every type merged together
+    total = None
+    for sale_type in moments.index.get_level_values('type').unique():
+        part = moments.xs(sale_type, level='type')
+        total = part if total is None else merge_moments(total, part)
+    channels['total'] = total if total is not None else moments.droplevel('type')
+    for channel, sale_type in CHANNEL_TYPES.items():
+        if sale_type in moments.index.get_level_values('type'):
+            channels[channel] = moments.xs(sale_type, level='type')
+        else:
+            channels[channel] = moments.droplevel('type').iloc[:0]
+    return channels
+
+
+def dispensary_stats(path, chunksize=CHUNKSIZE):
+    """{(channel, stat): daily series} for one per-dispensary file."""
+    out = {}
+    for channel, moments in channel_moments(file_moments(path, chunksize)).items():
+        stats = daily_stats(moments)
+        for stat in STAT_SUFFIXES:
+            out[(channel, stat)] = stats[stat]
+    return out
+
+
+def _dispensary_task(task):
+    global_id, path, chunksize = task
+    return global_id, dispensary_stats(path, chunksize)
+
+
+def sales_files(path):
+    """(global_id, file path) of every sales_<global_id>.csv in a directory."""
+    files = []
+    for name in sorted(os.listdir(path)):
+        match = FILE_PATTERN.search(name)
+        if match:
+            files.append((match.group(1), os.path.join(path, name)))
+    return files
+
+
+def build_salesMatrices(path, out_dir=".", workers=None, chunksize=CHUNKSIZE):
+    """Aggregates every per-dispensary file under path on a process pool and
+    writes the nine wide matrices to out_dir.  Returns the written paths.
+    """
+    files = sales_files(path)
+    columns = {key: {} for key in
+               [(channel, stat) for channel in ['total'] + list(CHANNEL_TYPES) for stat in STAT_SUFFIXES]}
+    tasks = [(global_id, file_path, chunksize) for global_id, file_path in files]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for global_id, stats in pool.map(_dispensary_task, tasks):
+            for key, series in stats.items():
+                if len(series):
+                    columns[key][global_id] = series
+    written = []
+    for (channel, stat), series in columns.items():
+        wide = pd.concat(series, axis=1).sort_index() if series else pd.DataFrame()
+        wide.index.name = 'sold_at'
+        out_path = os.path.join(out_dir, channel + STAT_SUFFIXES[stat] + ".csv")
+        wide.to_csv(out_path)
+        written.append(out_path)
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the wide daily sales matrices from the per-dispensary sales files.")
+    parser.add_argument("path", help="directory of sales_<global_id>.csv files")
+    parser.add_argument("--out-dir", default=".")
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--chunksize", type=int, default=CHUNKSIZE)
+    args = parser.parse_args()
+    t0 = time.time()
+    written = build_salesMatrices(args.path, args.out_dir, args.workers, args.chunksize)
+    print("Wrote {} in {:.1f}s".format(", ".join(written), time.time() - t0))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 15:48:09 2026
+
+@author: stark
+"""
+
+"""Benchmarks of the data processing behind the pages, on synthetic data.
+
+Every run generates wide daily sales matrices shaped like total_sales.csv,
+medical_sales.csv and recreational_sales.csv (plus a dispensary_info.csv)
+for each requested number of dispensaries and years, in a scratch directory,
+and times the page computations on them without Streamlit:
+    load_csv             load_salesData of the three channels
+    load_ragged          the same files as float32 RaggedSales tables
+    convert_store        sales_store conversion of the three channels
+    build_rollups        every channel x period rollup
+    single_company_csv   query + resample of single_company_stats, as first written
+    single_company       rollups + range index, as single_company_stats does now
+    statewide_csv        Statewide branch of company_comparison, as first written
+    statewide            peer tables + range index
+    local_csv            Local (Same City) branch, as first written
+    local                column reads of the peer group + range index
+Both local stages compare every sampled dispensary against the same peers,
+the other dispensaries of its city.
+Every stage starts from an empty sales_data cache, so stages that reuse
+shared datasets pay for building them.  Like timeit.repeat, a stage is run
+REPEAT times with the garbage collector off; the fastest run is its wall
+time, the slowest is kept as well to show the spread.  It is then run once
+more under tracemalloc for its peak memory, so the tracing does not skew
+the timings.  Memory-mapped reads do not count as allocations.
+
+The results are saved as JSON; pass an earlier file with --compare to get
+the ratio of every stage against it, with the stages that got slower by more
+than TOLERANCE, beyond the spread of the earlier run's repeats, flagged:
+    python sales_benchmark.py --dispensaries 100 1000 5000 --years 3 10 --out bench.json
+    python sales_benchmark.py --compare bench.json
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from sales_data import clear_cache, get_dispensaryInfo, load_salesData
+from sales_ranges import dispensary_rollup, get_rangeIndex, peer_rollup
+from sales_ragged import RaggedSales
+from sales_rollups import CHANNEL_FILES, RESAMPLE_RULES, build_rollups
+from sales_store import STORE_DIR, convert_salesData, get_salesColumns
+
+DISPENSARIES = [100, 1000, 5000]
+YEARS = [3, 10]
+SAMPLES = 5
+REPEAT = 5
+RESULTS_FILE = "benchmark_results.json"
+# stages this much slower than the compared run are flagged
+TOLERANCE = 0.25
+
+
+def synthetic_salesData(n_dispensaries, n_years, seed=0, start="2017-07-06"):
+    """{channel: wide daily sales frame} shaped like the real matrices.
+    Every dispensary opens at a random day (and a few close early), has a
+    weekly pattern, a trend, the odd closed day and a random medical share.
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(start, periods=int(round(365.25 * n_years)), freq='D', name='sold_at')
+    n, m = len(dates), n_dispensaries
+    columns = ["WAWA1.B{:X}".format(j) for j in range(m)]
+    t = np.arange(n)[:, None]
+    level = rng.lognormal(8.0, 0.8, m)
+    weekly = 1 + 0.2 * np.sin(2 * np.pi * (t + rng.integers(0, 7, m)) / 7)
+    trend = 1 + rng.normal(0.1, 0.1, m) * t / 365.25
+    total = level * weekly * np.maximum(trend, 0.1) * rng.lognormal(0.0, 0.3, (n, m))
+    total[rng.random((n, m)) < 0.03] = 0.0
+    opened = rng.integers(0, n // 2, m)
+    closed = np.where(rng.random(m) < 0.1, rng.integers(n // 2, n, m), n)
+    outside = (t < opened) | (t >= closed)
+    medical_share = np.where(rng.random(m) < 0.6, rng.uniform(0.0, 0.2, m), 0.0)
+    medical = total * medical_share
+    channels = {}
+    for channel, values in (('total', total), ('medical', medical), ('recreational', total - medical)):
+        values = np.where(outside, np.nan, values)
+        channels[channel] = pd.DataFrame(values, index=dates, columns=columns)
+    return channels
+
+
+def synthetic_dispensaryInfo(columns, seed=0):
+    """Geocoded table for synthetic dispensaries, about ten per city."""
+    rng = np.random.default_rng(seed)
+    m = len(columns)
+    n_cities = max(1, m // 10)
+    centers = np.column_stack([rng.uniform(45.7, 48.9, n_cities), rng.uniform(-123.5, -117.2, n_cities)])
+    city = rng.integers(0, n_cities, m)
+    return pd.DataFrame({'global_id': columns,
+                         'name': ["DISPENSARY {}".format(j) for j in range(m)],
+                         'city': ["CITY {}".format(c) for c in city],
+                         'Lat': centers[city, 0] + rng.normal(0, 0.05, m),
+                         'Lon': centers[city, 1] + rng.normal(0, 0.05, m)})
+
+
+def write_syntheticData(work_dir, n_dispensaries, n_years, seed=0):
+    """Writes the synthetic .csv files the pages read into work_dir."""
+    channels = synthetic_salesData(n_dispensaries, n_years, seed)
+    for channel, df in channels.items():
+        df.to_csv(os.path.join(work_dir, CHANNEL_FILES[channel]))
+    synthetic_dispensaryInfo(channels['total'].columns, seed).to_csv(
+        os.path.join(work_dir, "dispensary_info.csv"), index=False)
+
+
+@contextmanager
+def working_directory(path):
+    """The page code reads its files relative to the working directory."""
+    cwd = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(cwd)
+
+
+def legacy_salesSeries(df, company_id, rule, others=None):
+    """query + resample of one dispensary (and its peers), as in the first
+    version of the pages.
+    """
+    query_string = "`" + str(company_id) + "` > 0"
+    own = df.query(query_string)[str(company_id)].resample(rule).sum().to_frame()
+    if others is None:
+        return own
+    return own, df.query(query_string)[others].resample(rule).sum()
+
+
+def stage_loadCsv(ctx):
+    ctx['frames'] = {channel: load_salesData(filename) for channel, filename in CHANNEL_FILES.items()}
+
+
+def stage_loadRagged(ctx):
+    ctx['ragged'] = {channel: RaggedSales.from_csv(filename) for channel, filename in CHANNEL_FILES.items()}
+
+
+def stage_convertStore(ctx):
+    for filename in CHANNEL_FILES.values():
+        convert_salesData(filename, STORE_DIR)
+
+
+def stage_buildRollups(ctx):
+    build_rollups(STORE_DIR, verbose=False)
+
+
+def stage_singleCompanyCsv(ctx):
+    for company_id in ctx['sample']:
+        for rule in RESAMPLE_RULES.values():
+            for df in ctx['frames'].values():
+                legacy_salesSeries(df, company_id, rule)
+
+
+def stage_singleCompany(ctx):
+    total_index = get_rangeIndex('total')
+    for company_id in ctx['sample']:
+        min_date, max_date = total_index.span(company_id)
+        for period in RESAMPLE_RULES:
+            for channel in CHANNEL_FILES:
+                dispensary_rollup(channel, period, company_id, min_date, max_date)
+        total_index.totals(min_date, max_date, [company_id])
+
+
+def stage_statewideCsv(ctx):
+    frames = ctx['frames']
+    for company_id in ctx['sample']:
+        others = [c for c in frames['total'].columns if c != company_id]
+        for df in frames.values():
+            legacy_salesSeries(df, company_id, RESAMPLE_RULES['Daily'], others)
+        frames['total'][others].sum().mean()
+
+
+def stage_statewide(ctx):
+    total_index = get_rangeIndex('total')
+    for company_id in ctx['sample']:
+        total_index.table(total_index.dates[0], total_index.dates[-1], total_index.columns)
+        for channel in CHANNEL_FILES:
+            peer_rollup(channel, 'Daily', company_id, total_index.dates[0], total_index.dates[-1])
+
+
+def local_peers(sample):
+    """{global_id: the other dispensaries of its city} of the sampled dispensaries."""
+    info = get_dispensaryInfo("dispensary_info.csv")
+    cities = info.set_index('global_id')['city']
+    return {company_id: [c for c in cities.index[cities == cities[company_id]] if c != company_id]
+            for company_id in sample}
+
+
+def stage_localCsv(ctx):
+    frames = ctx['frames']
+    for company_id in ctx['sample']:
+        others = ctx['peers'][company_id]
+        for df in frames.values():
+            legacy_salesSeries(df, company_id, RESAMPLE_RULES['Daily'], others)
+        frames['total'][others].sum().mean()
+
+
+def stage_local(ctx):
+    total_index = get_rangeIndex('total')
+    min_date, max_date = total_index.dates[0], total_index.dates[-1]
+    for company_id in ctx['sample']:
+        others = ctx['peers'][company_id]
+        local_ids = [company_id] + others
+        query_string = "`" + str(company_id) + "` > 0"
+        for channel, filename in CHANNEL_FILES.items():
+            df = get_salesColumns(filename, local_ids)
+            dispensary_rollup(channel, 'Daily', company_id, min_date, max_date)
+            df.loc[min_date:max_date].query(query_string)[others].resample(RESAMPLE_RULES['Daily']).sum()
+        total_index.totals(min_date, max_date, local_ids)
+
+
+STAGES = [('load_csv', stage_loadCsv),
+          ('load_ragged', stage_loadRagged),
+          ('convert_store', stage_convertStore),
+          ('build_rollups', stage_buildRollups),
+          ('single_company_csv', stage_singleCompanyCsv),
+          ('single_company', stage_singleCompany),
+          ('statewide_csv', stage_statewideCsv),
+          ('statewide', stage_statewide),
+          ('local_csv', stage_localCsv),
+          ('local', stage_local)]
+
+
+def measure(stage, ctx, repeat=REPEAT):
+    """Wall times of repeat runs (seconds) and peak traced memory (MB) of
+    one stage.
+    """
+    times = []
+    for _ in range(repeat):
+        clear_cache()
+        # as timeit does, so collections triggered by earlier runs are not timed
+        gc.collect()
+        gc.disable()
+        try:
+            t0 = time.perf_counter()
+            stage(ctx)
+            times.append(time.perf_counter() - t0)
+        finally:
+            gc.enable()
+    clear_cache()
+    tracemalloc.start()
+    try:
+        stage(ctx)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return times, peak / 2**20
+
+
+def run_benchmarks(dispensaries=DISPENSARIES, years=YEARS, samples=SAMPLES, stages=None, seed=0,
+                   repeat=REPEAT):
+    """Runs the stages on every size and returns one record per size and stage."""
+    records = []
+    selected = [(name, stage) for name, stage in STAGES if stages is None or name in stages]
+    for n_years in years:
+        for n_dispensaries in dispensaries:
+            work_dir = tempfile.mkdtemp(prefix="sales_benchmark_")
+            try:
+                t0 = time.perf_counter()
+                write_syntheticData(work_dir, n_dispensaries, n_years, seed)
+                print("{} dispensaries x {} years: generated in {:.1f}s".format(
+                    n_dispensaries, n_years, time.perf_counter() - t0))
+                with working_directory(work_dir):
+                    rng = np.random.default_rng(seed)
+                    columns = pd.read_csv(CHANNEL_FILES['total'], nrows=0).columns[1:]
+                    ctx = {'sample': list(rng.choice(columns, min(samples, len(columns)), replace=False))}
+                    ctx['peers'] = local_peers(ctx['sample'])
+                    # later stages need the loaded frames and the store
+                    for name, stage in STAGES:
+                        if name in ('load_csv', 'convert_store', 'build_rollups') and name not in dict(selected):
+                            stage(ctx)
+                    for name, stage in selected:
+                        times, peak_mb = measure(stage, ctx, repeat)
+                        records.append({'dispensaries': n_dispensaries, 'years': n_years, 'stage': name,
+                                        'seconds': min(times), 'seconds_max': max(times), 'peak_mb': peak_mb})
+                        print("    {:<20} {:>9.3f}s {:>9.1f} MB".format(name, min(times), peak_mb))
+            finally:
+                clear_cache()
+                shutil.rmtree(work_dir, ignore_errors=True)
+    return records
+
+
+def save_results(records, path=RESULTS_FILE):
+    meta = {'created': time.strftime("%Y-%m-%d %H:%M:%S"),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'cpus': os.cpu_count()}
+    with open(path, 'w') as f:
+        json.dump({'meta': meta, 'results': records}, f, indent=1)
+
+
+def compare_results(records, path, tolerance=TOLERANCE):
+    """Ratio of every stage's time and memory against an earlier results file.
+    A stage is flagged when its best time is slower by more than tolerance
+    and also slower than every repeat of the earlier run, so run-to-run
+    noise of the short stages is not reported as a regression.
+    """
+    with open(path) as f:
+        before = pd.DataFrame(json.load(f)['results'])
+    if 'seconds_max' not in before:
+        # files written before the repeats were recorded
+        before['seconds_max'] = before['seconds']
+    keys = ['dispensaries', 'years', 'stage']
+    merged = pd.DataFrame(records).merge(before, on=keys, suffixes=('', '_before'))
+    merged['time_ratio'] = merged['seconds'] / merged['seconds_before']
+    merged['memory_ratio'] = merged['peak_mb'] / merged['peak_mb_before']
+    merged['slower'] = (merged['time_ratio'] > 1 + tolerance) & (merged['seconds'] > merged['seconds_max_before'])
+    return merged[keys + ['seconds_before', 'seconds', 'time_ratio', 'peak_mb_before', 'peak_mb',
+                          'memory_ratio', 'slower']]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the page computations on synthetic sales matrices.")
+    parser.add_argument("--dispensaries", type=int, nargs='+', default=DISPENSARIES)
+    parser.add_argument("--years", type=int, nargs='+', default=YEARS)
+    parser.add_argument("--samples", type=int, default=SAMPLES, help="dispensaries selected per page stage")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="runs per stage, the fastest is kept")
+    parser.add_argument("--stages", nargs='+', choices=[name for name, _ in STAGES])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=RESULTS_FILE)
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    args = parser.parse_args()
+    records = run_benchmarks(args.dispensaries, args.years, args.samples, args.stages, args.seed,
+                             args.repeat)
+    save_results(records, args.out)
+    print("Saved {}".format(args.out))
+    if args.compare:
+        with pd.option_context('display.width', 200, 'display.max_rows', None):
+            print(compare_results(records, args.compare).round(3).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 07:05:12 2026
+
+@author: stark
+"""
+
+"""Shared data-access layer for the streamlit pages.
+
+Every dataset is loaded once per process and the same object is handed to
+every session, so callers must treat the returned frames as read-only.  An
+entry is reloaded when the file behind it changes on disk.
+
+The process-wide lock only guards the cache dictionary; every entry has its
+own lock held while it is loaded, so a slow load (e.g. the warmup thread
+parsing a large .csv) only blocks the sessions waiting for that same
+dataset, and concurrent requests for it still load it once.
+"""
+import hashlib
+import os
+import threading
+
+import pandas as pd
+
+# the wide sales tables the pages read, one per channel and statistic
+SALES_FILES = ["total_sales.csv", "medical_sales.csv", "recreational_sales.csv",
+               "total_salesAverage.csv", "medical_salesAverage.csv", "recreational_salesAverage.csv",
+               "total_salesStddev.csv", "medical_salesStddev.csv", "recreational_salesStddev.csv"]
+
+# compare file contents when the mtime/size changes, so a touched but
+# otherwise unchanged file does not trigger a reload
+CHECK_HASH = True
+# the columnar store's files are swapped in atomically by their build step,
+# so a new mtime/size always means new contents; hashing them would read the
+# whole matrix just to open its memory map
+UNHASHED_SUFFIXES = ('.npy',)
+
+_cache = {}
+_cache_lock = threading.RLock()
+_key_locks = {}
+_cache_stats = {'hits': 0, 'misses': 0, 'reloads': 0}
+
+
+def load_salesData(filename):
+    df = pd.read_csv(filename)
+    df['sold_at'] = df['sold_at'].astype('datetime64[ns]')
+    df = df.set_index('sold_at')
+    return df
+
+
+def _file_signature(filename):
+    stat = os.stat(filename)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _file_hash(filename):
+    digest = hashlib.md5()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cached_load(filename, loader, key=None):
+    """Returns loader(filename), reusing the result while the file is unchanged.
+    Parameters
+    ----------
+    filename:
+        path of the file backing the dataset.
+    loader:
+        function that builds the dataset from the file.
+    key:
+        optional extra key, for loaders that build several datasets from
+        the same file.
+    """
+    path = os.path.abspath(filename)
+    key = (path, loader.__module__, loader.__qualname__, key)
+    signature = _file_signature(path)
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is not None and entry['signature'] == signature:
+            _cache_stats['hits'] += 1
+            return entry['data']
+        key_lock = _key_locks.setdefault(key, threading.Lock())
+    with key_lock:
+        with _cache_lock:
+            entry = _cache.get(key)
+            if entry is not None and entry['signature'] == signature:
+                # loaded by another session while this one waited
+                _cache_stats['hits'] += 1
+                return entry['data']
+        digest = _file_hash(path) if CHECK_HASH and not path.endswith(UNHASHED_SUFFIXES) else None
+        if entry is not None and digest is not None and entry['hash'] == digest:
+            # file was touched but its contents did not change
+            with _cache_lock:
+                entry['signature'] = signature
+                _cache_stats['hits'] += 1
+            return entry['data']
+        data = loader(path)
+        with _cache_lock:
+            _cache_stats['misses'] += 1
+            if entry is not None:
+                _cache_stats['reloads'] += 1
+            _cache[key] = {'signature': signature, 'hash': digest, 'data': data}
+        return data
+
+
+def get_salesData(filename):
+    """Shared, read-only version of load_salesData(filename)."""
+    return cached_load(filename, load_salesData)
+
+
+def get_licenseInfo(filename="Licensees_0.csv"):
+    """Shared, read-only licensee table."""
+    return cached_load(filename, pd.read_csv)
+
+
+def get_dispensaryInfo(filename="dispensary_info.csv"):
+    """Shared, read-only geocoded dispensary table."""
+    return cached_load(filename, pd.read_csv)
+
+
+def cache_info():
+    """Returns the hit/miss/reload counters and the number of cached datasets."""
+    with _cache_lock:
+        info = dict(_cache_stats)
+        info['entries'] = len(_cache)
+    return info
+
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
+        for k in _cache_stats:
+            _cache_stats[k] = 0
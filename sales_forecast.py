@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 14:10:22 2026
+
+@author: stark
+"""
+
+"""Batched seasonal forecasts of the daily sales of every dispensary.
+
+Every dispensary and channel gets the same linear model of its daily sales
+    trend       intercept + slope per year
+    weekly      WEEKLY_HARMONICS sine/cosine pairs with a 7 day period
+    annual      ANNUAL_HARMONICS sine/cosine pairs with a 365.25 day period
+fitted over the last FIT_DAYS days of its active span (first to last day with
+sales, non-positive days counted as 0 like the Daily rollup).  A year is
+needed for the seasonal shape, but not for the level: a dispensary whose
+sales dropped or jumped during the year would get a steep trend that runs
+far past the current level (or below zero) over the horizon.  So with the
+seasonal terms held fixed, the intercept and slope are refitted on the last
+TREND_DAYS days, and the slope is damped over the horizon: day h after the
+data moves the trend by TREND_DAMPING + ... + TREND_DAMPING**h days' worth
+of slope, at most TREND_DAMPING / (1 - TREND_DAMPING) days.
+
+All the series share one design matrix X, so the normal equations of every
+dispensary come out of one matrix product
+    G[j] = X' diag(w_j) X,    b[j] = X' (w_j * y_j)
+where w_j masks the fitted days of j, and all the small systems are solved by
+one batched np.linalg.solve.  The raw data holds the odd day of absurd sales,
+so the fit is repeated a few times with Huber weights (iteratively reweighted
+least squares), each pass still one batched solve.  A light ridge keeps short
+series stable; the annual terms are shrunk further and dropped for
+dispensaries with less than a year of data.  The spread of the forecast band
+is the robust (MAD) scale of the daily residuals.
+
+The fitted parameters, the residual standard deviation and a forecast of
+every dispensary for at least HORIZON days, through the end of a month so the
+Monthly bins come out whole, are written to the store next to the rollups:
+    python sales_forecast.py [--store-dir sales_store] [--horizon 90]
+"""
+import argparse
+import os
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from pandas.tseries.frequencies import to_offset
+from pandas.tseries.offsets import MonthEnd
+
+from sales_data import cached_load
+from sales_ranges import daily_source
+from sales_rollups import CHANNEL_FILES, RESAMPLE_RULES, get_rollup
+from sales_store import STORE_DIR, SalesMatrix, get_salesColumns, write_salesMatrix
+
+WEEKLY_HARMONICS = 3
+ANNUAL_HARMONICS = 3
+HORIZON = 90
+FIT_DAYS = 365
+TREND_DAYS = 91
+TREND_DAMPING = 0.98
+RIDGE = 1.0
+# extra shrinkage of the annual terms, relative to the days fitted
+ANNUAL_RIDGE = 0.2
+# iteratively reweighted least squares with Huber weights
+ROBUST_ITERATIONS = 6
+HUBER_K = 1.345
+# dispensaries without sales in the last STALE_DAYS of the data are not forecast
+STALE_DAYS = 30
+Z_95 = 1.96
+
+
+def design_matrix(t):
+    """Trend and Fourier columns for days t counted from the start of the data."""
+    columns = [np.ones_like(t), t / 365.25]
+    for k in range(1, WEEKLY_HARMONICS + 1):
+        columns += [np.sin(2 * np.pi * k * t / 7), np.cos(2 * np.pi * k * t / 7)]
+    for k in range(1, ANNUAL_HARMONICS + 1):
+        columns += [np.sin(2 * np.pi * k * t / 365.25), np.cos(2 * np.pi * k * t / 365.25)]
+    return np.column_stack(columns)
+
+
+def _annual_columns():
+    first = 2 + 2 * WEEKLY_HARMONICS
+    return slice(first, first + 2 * ANNUAL_HARMONICS)
+
+
+def fit_seasonal(df, fit_days=FIT_DAYS, trend_days=TREND_DAYS):
+    """Fits the seasonal model to the last fit_days days of every column of a
+    daily sales frame at once, with the trend refitted on the last trend_days.
+    Returns (params, sigma, n_obs, last): the (n_columns, n_params)
+    coefficients, the robust residual standard deviation, the number of days
+    fitted and the position of the last day with sales of every column.
+    """
+    df = df.reindex(pd.date_range(df.index.min(), df.index.max(), freq='D'))
+    values = df.to_numpy(dtype=np.float64)
+    positive = values > 0
+    n, m = values.shape
+    has_sales = positive.any(axis=0)
+    first = np.where(has_sales, positive.argmax(axis=0), n)
+    last = np.where(has_sales, n - 1 - positive[::-1].argmax(axis=0), -1)
+    # only the last fit_days days are fitted, so the trend follows the recent level
+    lo = max(0, n - fit_days)
+    rows = np.arange(lo, n)[:, None]
+    w = ((rows >= first) & (rows <= last)).astype(np.float64)
+    y = np.where(positive[lo:], values[lo:], 0.0) * w
+    X = design_matrix(np.arange(lo, n, dtype=np.float64))
+    p = X.shape[1]
+    XX = (X[:, :, None] * X[:, None, :]).reshape(n - lo, p * p).T
+    n_obs = w.sum(axis=0)
+    ridge = np.full((m, p), RIDGE)
+    ridge[:, 0] = 0.0
+    ridge[:, _annual_columns()] += ANNUAL_RIDGE * n_obs[:, None]
+    ridge[n_obs < 365, _annual_columns()] = 1e9
+    weights = w
+    for _ in range(ROBUST_ITERATIONS):
+        # every column's normal equations from one (p*p, n) x (n, m) product
+        G = (XX @ weights).T.reshape(m, p, p)
+        G[:, np.arange(p), np.arange(p)] += ridge
+        # columns without sales would be singular, fit them to zero
+        G[n_obs == 0] = np.eye(p)
+        b = (X.T @ (weights * y)).T
+        params = np.linalg.solve(G, b[:, :, None])[:, :, 0]
+        resid = (y - X @ params.T) * w
+        with warnings.catch_warnings():
+            # columns without fitted days have no residuals
+            warnings.simplefilter('ignore', RuntimeWarning)
+            sigma = 1.4826 * np.nanmedian(np.where(w > 0, np.abs(resid), np.nan), axis=0)
+        sigma = np.where(np.isfinite(sigma) & (sigma > 0), sigma, 1.0)
+        # Huber weights, so data glitches and closed days barely move the fit
+        weights = w * np.minimum(1.0, HUBER_K * sigma / np.maximum(np.abs(resid), 1e-12))
+    params = _refit_trend(X, y, weights * (rows >= n - trend_days), params)
+    return params, np.where(n_obs > 0, sigma, np.nan), n_obs, last
+
+
+def _refit_trend(X, y, weights, params):
+    """params with the intercept and slope refitted, by weighted least
+    squares, to what the seasonal terms leave of y.  Columns with fewer than
+    two weighted days keep their trend.
+    """
+    r = y - X[:, 2:] @ params[:, 2:].T
+    t = X[:, 1:2]
+    sw, st, stt = weights.sum(axis=0), (weights * t).sum(axis=0), (weights * t * t).sum(axis=0)
+    sr, str_ = (weights * r).sum(axis=0), (weights * t * r).sum(axis=0)
+    det = sw * stt - st * st
+    ok = (np.count_nonzero(weights, axis=0) >= 2) & (det > 1e-12 * np.maximum(sw * stt, 1e-300))
+    slope = np.where(ok, (sw * str_ - st * sr) / np.where(ok, det, 1.0), 0.0)
+    intercept = (sr - slope * st) / np.where(ok, sw, 1.0)
+    params = params.copy()
+    params[ok, 0] = intercept[ok]
+    params[ok, 1] = slope[ok]
+    return params
+
+
+def forecast_frame(df, horizon=HORIZON):
+    """Fits every column of a daily sales frame and returns the forecast of
+    the horizon days after it, carried on to the end of that month, plus the
+    arrays describing the fit.
+    """
+    params, sigma, n_obs, last = fit_seasonal(df)
+    n = (df.index.max() - df.index.min()).days + 1
+    start = df.index.max() + pd.Timedelta(days=1)
+    horizon = (MonthEnd().rollforward(start + pd.Timedelta(days=horizon - 1)) - start).days + 1
+    t = np.arange(n, n + horizon, dtype=np.float64)
+    X = design_matrix(t)
+    # damped trend: the slope fades out instead of running on for the whole horizon
+    X[:, 1] = (n - 1 + np.cumsum(TREND_DAMPING ** np.arange(1, horizon + 1))) / 365.25
+    forecast = np.maximum(X @ params.T, 0.0)
+    # a forecast that is zero throughout is no forecast
+    forecast[:, (n_obs == 0) | (last < n - STALE_DAYS) | ~(forecast > 0).any(axis=0)] = np.nan
+    dates = pd.date_range(start, periods=horizon, freq='D', name='sold_at')
+    return (pd.DataFrame(forecast, index=dates, columns=df.columns),
+            {'params': params, 'sigma': sigma, 'n_obs': n_obs})
+
+
+def forecast_dir(channel, store_dir=STORE_DIR):
+    return os.path.join(store_dir, "forecasts", channel)
+
+
+def _build_forecast(task):
+    channel, store_dir, horizon = task
+    df = get_salesColumns(CHANNEL_FILES[channel], store_dir=store_dir)
+    forecast, arrays = forecast_frame(df, horizon)
+    out_dir = forecast_dir(channel, store_dir)
+    write_salesMatrix(forecast, out_dir, arrays=arrays)
+    return out_dir
+
+
+def build_forecasts(store_dir=STORE_DIR, horizon=HORIZON, workers=None):
+    """Fits and writes the forecasts of every channel, one channel per process."""
+    tasks = [(channel, store_dir, horizon) for channel in CHANNEL_FILES]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for out_dir in pool.map(_build_forecast, tasks):
+            print("-> {}".format(out_dir))
+
+
+class ForecastMatrix(SalesMatrix):
+    """SalesMatrix of one channel's forecast plus the residual spread of every column."""
+    def __init__(self, path):
+        super().__init__(path)
+        self.sigma = np.load(os.path.join(path, "sigma.npy"))
+
+    def band(self, global_id):
+        """Daily forecast with its residual standard deviation as a
+        forecast / sigma frame, empty if global_id is not forecast.
+        """
+        forecast = self.column(global_id)
+        sigma = self.sigma[self.positions([global_id])[0]]
+        return pd.DataFrame({'forecast': forecast, 'sigma': sigma}).dropna()
+
+
+class _MemoryForecast(ForecastMatrix):
+    """ForecastMatrix fitted in memory when the forecasts have not been built."""
+    def __init__(self, forecast, sigma):
+        self.path = None
+        self.values = forecast.to_numpy()
+        self.dates = forecast.index
+        self.columns = forecast.columns
+        self._positions = {c: i for i, c in enumerate(self.columns)}
+        self.sigma = sigma
+
+
+def _load_forecastMatrix(values_path):
+    return ForecastMatrix(os.path.dirname(values_path))
+
+
+def open_forecast(channel, store_dir=STORE_DIR):
+    """Shared ForecastMatrix of a channel, fitted in memory (once per process
+    and data file) when the forecasts have not been built.
+    """
+    path = os.path.join(forecast_dir(channel, store_dir), "values.npy")
+    if os.path.exists(path):
+        return cached_load(path, _load_forecastMatrix)
+
+    def _fit(source):
+        forecast, arrays = forecast_frame(get_salesColumns(CHANNEL_FILES[channel], store_dir=store_dir))
+        return _MemoryForecast(forecast, arrays['sigma'])
+    return cached_load(daily_source(channel, store_dir), _fit, key=('forecast', channel, store_dir))
+
+
+def get_forecast(channel, period, global_id, store_dir=STORE_DIR, z=Z_95):
+    """Forecast of one dispensary summed into the bins of period, with a
+    lower/upper band of z residual standard deviations.  Daily residuals are
+    treated as independent, so the spread of a bin grows with the square
+    root of its forecast days.
+
+    The bins are whole and labelled like get_rollup's: the bin the data ends
+    in adds the sales of its days before the forecast starts, so it is
+    comparable to the history's bins, and a last bin the forecast does not
+    reach the end of is dropped.
+    """
+    empty = pd.DataFrame(columns=['forecast', 'lower', 'upper'], dtype=float)
+    matrix = open_forecast(channel, store_dir)
+    if global_id not in matrix:
+        return empty
+    band = matrix.band(global_id)
+    if band.empty:
+        return empty
+    rule = RESAMPLE_RULES[period]
+    offset = to_offset(rule)
+    daily = band['forecast']
+    first, last = daily.index[0], daily.index[-1]
+    bin_start = offset.rollforward(first) - offset + pd.Timedelta(days=1)
+    if bin_start < first:
+        # days of the first bin already in the data
+        sales = get_rollup(channel, 'Daily', global_id, store_dir)[global_id]
+        sales = sales.reindex(pd.date_range(bin_start, first - pd.Timedelta(days=1), name=daily.index.name),
+                              fill_value=0.0)
+        daily = pd.concat([sales, daily])
+    binned = daily.resample(rule).sum().to_frame('forecast')
+    days = band['forecast'].resample(rule).count().reindex(binned.index, fill_value=0)
+    if offset.rollforward(last) != last:
+        binned, days = binned.iloc[:-1], days.iloc[:-1]
+    binned, days = binned[days > 0], days[days > 0]
+    spread = z * band['sigma'].iloc[0] * np.sqrt(days)
+    binned['lower'] = (binned['forecast'] - spread).clip(lower=0.0)
+    binned['upper'] = binned['forecast'] + spread
+    return binned
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fit and store the seasonal sales forecasts of every dispensary.")
+    parser.add_argument("--store-dir", default=STORE_DIR)
+    parser.add_argument("--horizon", type=int, default=HORIZON)
+    parser.add_argument("--workers", type=int)
+    args = parser.parse_args()
+    t0 = time.time()
+    build_forecasts(args.store_dir, args.horizon, args.workers)
+    print("Fitted forecasts in {:.1f}s".format(time.time() - t0))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,371 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 12:06:51 2026
+
+@author: stark
+"""
+
+"""Incremental ingestion of new LCB sales drops into the wide sales matrices.
+
+Instead of rerunning the notebook pipeline over the whole raw dump, every
+dispensary keeps a high-water mark: the last sold_at it has been ingested up
+to.  A drop (per-dispensary files as written by extract_pipeline.py) is read
+in chunks and only rows past a dispensary's reopened window are kept:
+    reopen = watermark - lookback days
+The rows of the last lookback days are kept in a small ledger per dispensary,
+so the days of the reopened window are recomputed from the ledger plus the
+drop, de-duplicated on the sale's global_id (latest updated_at wins).  Late
+rows and corrections of recent days therefore replace those days instead of
+being double counted, and ingesting the same drop twice changes nothing.
+Rows older than the reopened window are counted as too late and skipped.
+
+Only the rows of the matrices from the first reopened day on are rewritten;
+the unchanged head of every .csv file is left in place.  The columnar store
+entries, rollups and forecasts of the touched channels are then rebuilt from
+the merged files when the store exists.
+
+State lives in ingest_state/:
+    watermarks.json         per dispensary, the last ingested sold_at and the
+                            first day its ledger is complete from; seeded from
+                            total_sales.csv on the first run
+    recent/sales_<id>.csv   ledger of the rows of the last lookback days
+
+A dispensary is only reopened as far back as its ledger is complete, so right
+after seeding nothing before the watermark is recomputed.
+
+The ingested matrices should always equal a full rebuild of the complete
+history; --check rebuilds them with sales_aggregator.py from a directory of
+complete per-dispensary files and reports every cell that differs.
+
+Usage:
+    python sales_ingest.py new_drop_dir
+    python sales_ingest.py "E:/LCB_Drops/2021-02/*.csv" --raw --licensees Licensees_0.csv
+    python sales_ingest.py dispo_sales_data_repo --check
+"""
+import argparse
+import glob
+import json
+import os
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from extract_pipeline import dispensary_ids, extract_sales
+from sales_aggregator import (CHANNEL_TYPES, CHUNKSIZE, STAT_SUFFIXES, build_salesMatrices, channel_moments,
+                              chunk_moments, daily_stats, sales_files)
+from sales_data import load_salesData
+from sales_forecast import build_forecasts
+from sales_rollups import build_rollups
+from sales_store import STORE_DIR, convert_salesData
+
+STATE_DIR = "ingest_state"
+LOOKBACK_DAYS = 7
+# first day kept by dispo_sales_cleanUp in Cannabis_Sales.ipynb
+MIN_SOLD_AT = "2018-01-01"
+CHANNELS = ['total'] + list(CHANNEL_TYPES)
+LEDGER_COLUMNS = ['global_id', 'updated_at', 'type', 'sold_at', 'price_total', 'status']
+
+
+def clean_sales(df, start=MIN_SOLD_AT, end=None):
+    """Vectorized dispo_sales_cleanUp: numeric price_total, sold_at reduced to
+    the day and limited to [start, end).
+    """
+    df = df.copy()
+    df['price_total'] = pd.to_numeric(df['price_total'], errors='coerce')
+    df['sold_at'] = pd.to_datetime(df['sold_at'], errors='coerce').dt.normalize()
+    keep = df['price_total'].notna() & df['sold_at'].notna()
+    if start is not None:
+        keep &= df['sold_at'] >= pd.Timestamp(start)
+    if end is not None:
+        keep &= df['sold_at'] < pd.Timestamp(end)
+    return df[keep]
+
+
+def watermarks_path(state_dir=STATE_DIR):
+    return os.path.join(state_dir, "watermarks.json")
+
+
+def ledger_path(mme_id, state_dir=STATE_DIR):
+    return os.path.join(state_dir, "recent", "sales_{}.csv".format(mme_id))
+
+
+def seed_watermarks(filename="total_sales.csv"):
+    """Last day with sales of every dispensary in an existing matrix."""
+    df = load_salesData(filename)
+    return {c: {'sold_at': str(df[c].last_valid_index().date())} for c in df.columns
+            if df[c].last_valid_index() is not None}
+
+
+def load_watermarks(state_dir=STATE_DIR, data_dir="."):
+    path = watermarks_path(state_dir)
+    if not os.path.exists(path):
+        return seed_watermarks(os.path.join(data_dir, "total_sales.csv"))
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_json(obj, path):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(obj, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def ingest_dispensary(mme_id, path, state=None, state_dir=STATE_DIR,
+                      lookback=LOOKBACK_DAYS, start=MIN_SOLD_AT, end=None, chunksize=CHUNKSIZE):
+    """Recomputes the reopened window of one dispensary from its ledger and
+    the new rows of its drop file.
+    Returns a dict with the first recomputed day ('window_start', None when
+    nothing is new), the daily series of every (channel, stat) from that day
+    on, the new state and ledger rows, and the row counts.
+    """
+    state = state or {}
+    watermark = state.get('sold_at')
+    ledger_file = ledger_path(mme_id, state_dir)
+    has_ledger = os.path.exists(ledger_file) and 'ledger_from' in state
+    reopen = None
+    if watermark is not None:
+        reopen = pd.Timestamp(watermark)
+        # days the ledger does not fully hold cannot be recomputed
+        if has_ledger:
+            reopen = max(reopen - pd.Timedelta(days=lookback),
+                         pd.Timestamp(state['ledger_from']) - pd.Timedelta(days=1))
+    new_rows, late = [], 0
+    for chunk in pd.read_csv(path, chunksize=chunksize, dtype={'price_total': str},
+                             usecols=lambda c: c in LEDGER_COLUMNS):
+        chunk = clean_sales(chunk, start, end)
+        if reopen is not None:
+            fresh = chunk['sold_at'] > reopen
+            late += int((~fresh).sum())
+            chunk = chunk[fresh]
+        new_rows.append(chunk)
+    new_rows = pd.concat(new_rows, ignore_index=True)
+    if new_rows.empty:
+        return {'mme_id': mme_id, 'rows': 0, 'late': late, 'window_start': None}
+    rows = new_rows
+    if has_ledger:
+        ledger = pd.read_csv(ledger_file, dtype={'price_total': str})
+        rows = pd.concat([clean_sales(ledger, None, None), new_rows], ignore_index=True)
+    if 'global_id' in rows:
+        # corrections of a sale supersede the earlier version of it
+        if 'updated_at' in rows:
+            rows = rows.assign(_updated=pd.to_datetime(rows['updated_at'], errors='coerce'))
+            rows = rows.sort_values('_updated', kind='stable', na_position='first').drop(columns='_updated')
+        rows = rows.drop_duplicates('global_id', keep='last')
+    window_start = reopen + pd.Timedelta(days=1) if reopen is not None else rows['sold_at'].min()
+    rows = rows[rows['sold_at'] >= window_start]
+    series = {}
+    for channel, moments in channel_moments(chunk_moments(rows)).items():
+        stats = daily_stats(moments)
+        for stat in STAT_SUFFIXES:
+            series[(channel, stat)] = stats[stat]
+    new_watermark = rows['sold_at'].max()
+    if watermark is not None:
+        new_watermark = max(new_watermark, pd.Timestamp(watermark))
+    ledger_from = max(window_start, new_watermark - pd.Timedelta(days=lookback - 1))
+    ledger = rows[rows['sold_at'] >= ledger_from]
+    return {'mme_id': mme_id, 'rows': len(new_rows), 'late': late, 'window_start': window_start,
+            'series': series, 'ledger': ledger[[c for c in LEDGER_COLUMNS if c in ledger]],
+            'state': {'sold_at': str(new_watermark.date()), 'ledger_from': str(ledger_from.date())}}
+
+
+def _ingest_task(task):
+    return ingest_dispensary(*task)
+
+
+def span_end(df, mme_id, window_start):
+    """Last day of one column of a daily sums matrix before window_start,
+    None if the column has no earlier days.
+    """
+    if mme_id not in df:
+        return None
+    return df.loc[df.index < window_start, mme_id].last_valid_index()
+
+
+def merge_window(df, mme_id, window_start, series, fill=np.nan, last=None):
+    """Replaces the days of one column of a wide matrix from window_start on.
+    When the column's span already ends at last, before window_start, the
+    days between last and the first day of series are set to fill, as a full
+    rebuild fills every day of a dispensary's span.  The reopened window comes
+    from the total channel's watermark, so a channel can end well before it.
+    last is taken from the daily sums of the channel (see span_end), since
+    the Average and Stddev of a span can be NaN throughout.
+    Returns the merged matrix and the first day written.
+    """
+    if mme_id not in df:
+        df[mme_id] = np.nan
+    series = series[series.index >= window_start]
+    first = window_start
+    if last is not None and len(series):
+        first = min(last + pd.Timedelta(days=1), window_start)
+        series = series.reindex(pd.date_range(first, series.index.max(), freq='D'), fill_value=fill)
+    df = df.reindex(df.index.union(series.index))
+    df.index.name = 'sold_at'
+    df.loc[df.index >= window_start, mme_id] = np.nan
+    df.loc[series.index, mme_id] = series
+    return df, first
+
+
+def write_tail(df, filename, first_changed):
+    """Writes a wide matrix to filename, rewriting only the rows from
+    first_changed on when the columns of the file are unchanged.  The line
+    terminator of an existing file is kept (the tracked .csv files are CRLF),
+    so only the rewritten rows show up in a diff.
+    """
+    header = ','.join(['sold_at'] + [str(c) for c in df.columns]).encode()
+    terminator = '\n'
+    if os.path.exists(filename):
+        with open(filename, 'r+b') as f:
+            first_line = f.readline()
+            if first_line.endswith(b'\r\n'):
+                terminator = '\r\n'
+            if first_line.rstrip(b'\r\n') == header:
+                first = first_changed.strftime('%Y-%m-%d').encode()
+                offset = f.tell()
+                for line in iter(f.readline, b''):
+                    if line.split(b',', 1)[0][:10] >= first:
+                        break
+                    offset += len(line)
+                kept = df.index < first_changed
+                f.seek(offset)
+                f.truncate()
+                f.write(df[~kept].to_csv(header=False, lineterminator=terminator).encode())
+                return
+    with open(filename, 'w', newline='') as f:
+        df.to_csv(f, lineterminator=terminator)
+
+
+def ingest_sales(path, data_dir=".", store_dir=STORE_DIR, state_dir=STATE_DIR, lookback=LOOKBACK_DAYS,
+                 start=MIN_SOLD_AT, end=None, workers=None, chunksize=CHUNKSIZE):
+    """Ingests a directory of per-dispensary drop files.
+    Parameters
+    ----------
+    path:
+        directory of sales_<global_id>.csv files holding the new rows.
+    data_dir:
+        directory of the nine wide sales .csv files.
+    store_dir:
+        columnar store refreshed after the merge, skipped if it does not exist.
+    lookback:
+        number of days before a watermark that are recomputed on every ingest.
+    Returns a Counter of ingested, late and dispensary counts.
+    """
+    watermarks = load_watermarks(state_dir, data_dir)
+    tasks = [(mme_id, file_path, watermarks.get(mme_id), state_dir, lookback, start, end, chunksize)
+             for mme_id, file_path in sales_files(path)]
+    totals = Counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for result in pool.map(_ingest_task, tasks):
+            totals['rows'] += result['rows']
+            totals['late'] += result['late']
+            if result['window_start'] is not None:
+                results.append(result)
+    if not results:
+        return totals
+    totals['dispensaries'] = len(results)
+    first_changed = min(r['window_start'] for r in results)
+    for channel in CHANNELS:
+        spans = None
+        for stat, suffix in STAT_SUFFIXES.items():
+            filename = os.path.join(data_dir, channel + suffix + ".csv")
+            df = load_salesData(filename) if os.path.exists(filename) else pd.DataFrame(
+                index=pd.DatetimeIndex([], name='sold_at'))
+            if spans is None:
+                # the daily sums come first and give the spans of all three stats
+                spans = {r['mme_id']: span_end(df, r['mme_id'], r['window_start']) for r in results}
+            changed = first_changed
+            for r in results:
+                df, first = merge_window(df, r['mme_id'], r['window_start'], r['series'][(channel, stat)],
+                                         fill=0.0 if stat == 'sum' else np.nan, last=spans[r['mme_id']])
+                changed = min(changed, first)
+            write_tail(df, filename, changed)
+            if os.path.isdir(store_dir):
+                convert_salesData(filename, store_dir)
+    if os.path.isdir(store_dir):
+        build_rollups(store_dir)
+        build_forecasts(store_dir)
+    # state is committed last, so an interrupted ingest is simply rerun
+    os.makedirs(os.path.join(state_dir, "recent"), exist_ok=True)
+    for r in results:
+        r['ledger'].to_csv(ledger_path(r['mme_id'], state_dir), index=False,
+                           date_format='%Y-%m-%d')
+        watermarks[r['mme_id']] = r['state']
+    _write_json(watermarks, watermarks_path(state_dir))
+    return totals
+
+
+def matrix_differences(df, expected, rtol=1e-9):
+    """Cells where two wide matrices differ, NaN matching NaN.  Days or
+    columns missing from one of them count as NaN there.
+    """
+    index = df.index.union(expected.index)
+    columns = df.columns.union(expected.columns)
+    a = df.reindex(index=index, columns=columns).to_numpy(dtype=np.float64)
+    b = expected.reindex(index=index, columns=columns).to_numpy(dtype=np.float64)
+    same = (np.isnan(a) & np.isnan(b)) | np.isclose(a, b, rtol=rtol, atol=1e-9)
+    rows, cols = np.nonzero(~same)
+    return pd.DataFrame({'sold_at': index[rows], 'global_id': columns[cols],
+                         'ingested': a[rows, cols], 'rebuilt': b[rows, cols]})
+
+
+def check_against_rebuild(path, data_dir=".", workers=None, chunksize=CHUNKSIZE):
+    """Rebuilds the nine matrices from the complete per-dispensary files in
+    path and compares them with the ingested ones in data_dir.
+    Returns {file name: differing cells}.
+    """
+    differences = {}
+    with tempfile.TemporaryDirectory() as out_dir:
+        build_salesMatrices(path, out_dir, workers, chunksize)
+        for channel in CHANNELS:
+            for suffix in STAT_SUFFIXES.values():
+                name = channel + suffix + ".csv"
+                differences[name] = matrix_differences(load_salesData(os.path.join(data_dir, name)),
+                                                       load_salesData(os.path.join(out_dir, name)))
+    return differences
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest a new LCB sales drop into the wide sales matrices.")
+    parser.add_argument("path", help="directory of sales_<global_id>.csv files, or a glob of raw files with --raw")
+    parser.add_argument("--check", action='store_true',
+                        help="compare the matrices in --data-dir with a rebuild from the complete files in path")
+    parser.add_argument("--raw", action='store_true', help="extract the per-dispensary files from a raw dump first")
+    parser.add_argument("--licensees", help="with --raw, only extract dispensaries listed in this Licensees_0.csv")
+    parser.add_argument("--sep", default='\t')
+    parser.add_argument("--data-dir", default=".")
+    parser.add_argument("--store-dir", default=STORE_DIR)
+    parser.add_argument("--state-dir", default=STATE_DIR)
+    parser.add_argument("--lookback", type=int, default=LOOKBACK_DAYS)
+    parser.add_argument("--start", default=MIN_SOLD_AT)
+    parser.add_argument("--end")
+    parser.add_argument("--workers", type=int)
+    args = parser.parse_args()
+    t0 = time.time()
+    if args.check:
+        differences = check_against_rebuild(args.path, args.data_dir, args.workers)
+        for name, cells in differences.items():
+            print("{:<32} {} cells differ".format(name, len(cells)))
+            if len(cells):
+                print(cells.head(10).to_string(index=False))
+        if any(len(cells) for cells in differences.values()):
+            raise SystemExit(1)
+        return
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = args.path
+        if args.raw:
+            mme_ids = dispensary_ids(args.licensees) if args.licensees else None
+            extract_sales(glob.glob(args.path), tmp_dir, mme_ids=mme_ids, sep=args.sep, workers=args.workers)
+            path = tmp_dir
+        totals = ingest_sales(path, args.data_dir, args.store_dir, args.state_dir, args.lookback,
+                              args.start, args.end, args.workers)
+    print("Ingested {:,} rows for {} dispensaries ({:,} rows too late) in {:.1f}s".format(
+        totals['rows'], totals['dispensaries'], totals['late'], time.time() - t0))
+
+
+if __name__ == "__main__":
+    main()
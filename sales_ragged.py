@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 19:10:27 2026
+
+@author: stark
+"""
+
+"""Ragged, float32 in-memory representation of the wide sales tables.
+
+Every dispensary only has data between its first and last active day, so
+most of a wide date x dispensary table is NaN.  RaggedSales keeps only the
+span of every dispensary, as a contiguous float32 slice of one shared buffer:
+    values    1-D float32 buffer, dispensary after dispensary
+    offsets   int64, dispensary j is values[offsets[j]:offsets[j + 1]]
+    starts    int64, row of the shared date index its first value belongs to
+NaNs inside a span (e.g. the Average and Stddev of a closed day) are kept.
+A dispensary's series is a view of the buffer, never a copy, and totals,
+day counts and daily sums over the whole state (or any group) are single
+numpy reductions over the buffer.  Sums are accumulated in float64; float32
+keeps about seven significant digits of every daily value.
+
+frame() rebuilds the load_salesData layout (NaN outside the spans) for the
+requested columns only, so callers of the dense frames keep working:
+    ragged = get_raggedSales("total_sales.csv")
+    ragged.series(global_id)              # zero-copy, the dispensary's span
+    ragged.totals()                       # every dispensary at once
+    ragged.frame([global_id] + others)    # same as load_salesData()[...]
+
+python sales_ragged.py prints the memory of every table, dense and ragged.
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from sales_data import SALES_FILES, cached_load
+
+
+def _spans(values):
+    """First row and length of the finite span of every column of a 2-D array."""
+    finite = np.isfinite(values)
+    has_data = finite.any(axis=0)
+    first = np.where(has_data, finite.argmax(axis=0), 0)
+    last = np.where(has_data, len(values) - 1 - finite[::-1].argmax(axis=0), -1)
+    return first.astype(np.int64), (last - first + 1).clip(0).astype(np.int64)
+
+
+def _segments(starts, lengths):
+    """Positions of every element of consecutive segments, as one flat array."""
+    total = int(lengths.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.int64)
+    ends = np.cumsum(lengths)
+    return np.repeat(starts - (ends - lengths), lengths) + np.arange(total)
+
+
+class RaggedSales:
+    """Read-only ragged sales table.
+    Parameters
+    ----------
+    dates:
+        shared sold_at index.
+    columns:
+        global_id of every dispensary, in buffer order.
+    values, offsets, starts:
+        the float32 buffer, the (n_columns + 1) buffer offsets and the
+        first row of every dispensary, as described above.
+    """
+    def __init__(self, dates, columns, values, offsets, starts):
+        self.dates = pd.DatetimeIndex(dates, name='sold_at')
+        self.columns = pd.Index(columns)
+        self.values = values
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.lengths = np.diff(self.offsets)
+        self._positions = {c: j for j, c in enumerate(self.columns)}
+        self.values.flags.writeable = False
+
+    @classmethod
+    def from_frame(cls, df):
+        """Ragged copy of a sold_at-indexed wide frame."""
+        values = df.to_numpy(dtype=np.float32)
+        starts, lengths = _spans(values)
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        inside = _segments(starts, lengths)
+        columns = np.repeat(np.arange(values.shape[1]), lengths)
+        return cls(df.index, df.columns, values[inside, columns], offsets, starts)
+
+    @classmethod
+    def from_csv(cls, filename):
+        """Ragged table of a wide sales .csv file.  The values are parsed
+        straight to float32, so the dense intermediate is half the size of
+        load_salesData's.
+        """
+        header = pd.read_csv(filename, nrows=0).columns
+        df = pd.read_csv(filename, dtype={c: np.float32 for c in header if c != 'sold_at'})
+        df['sold_at'] = df['sold_at'].astype('datetime64[ns]')
+        return cls.from_frame(df.set_index('sold_at'))
+
+    def __len__(self):
+        return len(self.columns)
+
+    def __contains__(self, global_id):
+        return global_id in self._positions
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes + self.offsets.nbytes + self.starts.nbytes + self.lengths.nbytes
+
+    def positions(self, global_ids):
+        missing = [c for c in global_ids if c not in self._positions]
+        if missing:
+            raise KeyError("{} not in the ragged table".format(missing))
+        return np.array([self._positions[c] for c in global_ids], dtype=np.int64)
+
+    def _select(self, global_ids):
+        if global_ids is None:
+            return np.arange(len(self.columns)), self.columns
+        global_ids = list(global_ids)
+        return self.positions(global_ids), pd.Index(global_ids)
+
+    def view(self, global_id):
+        """Values of one dispensary's span, a view of the shared buffer."""
+        j = self._positions[global_id]
+        return self.values[self.offsets[j]:self.offsets[j + 1]]
+
+    def span(self, global_id):
+        """First and last date of one dispensary's data, None if it has none."""
+        j = self._positions[global_id]
+        if self.lengths[j] == 0:
+            return None
+        return self.dates[self.starts[j]], self.dates[self.starts[j] + self.lengths[j] - 1]
+
+    def series(self, global_id):
+        """float32 series of one dispensary over its span, without copying."""
+        j = self._positions[global_id]
+        start = self.starts[j]
+        return pd.Series(self.view(global_id), index=self.dates[start:start + self.lengths[j]],
+                         name=global_id, copy=False)
+
+    def _elements(self, cols):
+        """Buffer positions, rows and column numbers of the selected dispensaries."""
+        lengths = self.lengths[cols]
+        positions = _segments(self.offsets[cols], lengths)
+        rows = _segments(self.starts[cols], lengths)
+        return positions, rows, np.repeat(np.arange(len(cols)), lengths)
+
+    def frame(self, global_ids=None, dtype=np.float64):
+        """Same layout as load_salesData, restricted to the requested columns."""
+        cols, index = self._select(global_ids)
+        out = np.full((len(self.dates), len(cols)), np.nan, dtype=dtype, order='F')
+        positions, rows, columns = self._elements(cols)
+        out[rows, columns] = self.values[positions]
+        return pd.DataFrame(out, index=self.dates, columns=index, copy=False)
+
+    def _reduce(self, data, cols):
+        """Per-dispensary float64 sum of data (one value per buffer element)."""
+        sums = np.zeros(len(self.columns))
+        nonempty = self.lengths > 0
+        if nonempty.any():
+            sums[nonempty] = np.add.reduceat(data, self.offsets[:-1][nonempty], dtype=np.float64)
+        return sums[cols]
+
+    def totals(self, global_ids=None, positive=True):
+        """Total of every dispensary, over its positive days by default as the
+        pages count sales, or over every non-NaN value.
+        """
+        cols, index = self._select(global_ids)
+        keep = self.values > 0 if positive else np.isfinite(self.values)
+        return pd.Series(self._reduce(np.where(keep, self.values, 0.0), cols), index=index)
+
+    def sales_days(self, global_ids=None):
+        """Number of days with positive sales of every dispensary."""
+        cols, index = self._select(global_ids)
+        return pd.Series(self._reduce(self.values > 0, cols).astype(np.int64), index=index)
+
+    def means(self, global_ids=None):
+        """Mean of the non-NaN values of every dispensary's span."""
+        cols, index = self._select(global_ids)
+        finite = np.isfinite(self.values)
+        counts = self._reduce(finite, cols)
+        sums = self._reduce(np.where(finite, self.values, 0.0), cols)
+        return pd.Series(sums / np.where(counts > 0, counts, np.nan), index=index)
+
+    def daily_totals(self, global_ids=None, positive=True):
+        """Sum over the selected dispensaries of every day, like
+        load_salesData()[global_ids].sum(axis=1) but over positive days only
+        by default.
+        """
+        cols, _ = self._select(global_ids)
+        positions, rows, _ = self._elements(cols)
+        values = self.values[positions]
+        keep = values > 0 if positive else np.isfinite(values)
+        sums = np.bincount(rows[keep], weights=values[keep], minlength=len(self.dates))
+        return pd.Series(sums, index=self.dates)
+
+    def daily_counts(self, global_ids=None):
+        """Number of the selected dispensaries with positive sales every day."""
+        cols, _ = self._select(global_ids)
+        positions, rows, _ = self._elements(cols)
+        counts = np.bincount(rows[self.values[positions] > 0], minlength=len(self.dates))
+        return pd.Series(counts, index=self.dates)
+
+
+def get_raggedSales(filename):
+    """Shared, read-only RaggedSales of a wide sales .csv file."""
+    return cached_load(filename, RaggedSales.from_csv)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the memory of the dense and ragged sales tables.")
+    parser.add_argument("files", nargs='*', default=SALES_FILES)
+    args = parser.parse_args()
+    dense_total = ragged_total = 0
+    for filename in args.files:
+        ragged = RaggedSales.from_csv(filename)
+        dense = len(ragged.dates) * len(ragged.columns) * 8
+        dense_total += dense
+        ragged_total += ragged.nbytes
+        print("{:<32} {:>6} x {:<6} dense {:>9.2f} MB  ragged {:>9.2f} MB  ({:.0%})".format(
+            filename, len(ragged.dates), len(ragged.columns), dense / 2**20, ragged.nbytes / 2**20,
+            ragged.nbytes / dense))
+    if dense_total:
+        print("{:<32} {:>15} dense {:>9.2f} MB  ragged {:>9.2f} MB  ({:.0%})".format(
+            "all", "", dense_total / 2**20, ragged_total / 2**20, ragged_total / dense_total))
+
+
+if __name__ == "__main__":
+    main()
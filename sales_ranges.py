@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 13:02:36 2026
+
+@author: stark
+"""
+
+"""Prefix-sum index over the daily sales matrices for arbitrary date ranges.
+
+For every channel the index keeps, per dispensary, the running total of its
+positive daily sales and the running count of days with sales:
+    sums[i]    total sales of the first i days
+    counts[i]  number of days with sales among the first i days
+so the total or count between any two dates is the difference of two rows,
+for one dispensary or all of them at once.  The first and last day with
+sales of every dispensary is kept as well; the average daily sales over a
+range is its total divided by the calendar days of the range inside that
+span, which is how the pages average a series that was resampled after
+dropping non-positive days.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+from pandas.tseries.frequencies import to_offset
+
+from peer_comparison import _pct_diff, _percentile, peer_stats
+from sales_data import cached_load
+from sales_rollups import CHANNEL_FILES, RESAMPLE_RULES, get_rollup
+from sales_store import STORE_DIR, get_salesColumns, matrix_dir
+
+
+class SalesRangeIndex:
+    """Range totals, counts and averages of one daily sales table.
+    Parameters
+    ----------
+    df:
+        sold_at-indexed daily sales, one column per dispensary.
+    """
+    def __init__(self, df):
+        values = df.to_numpy(dtype=np.float64)
+        positive = values > 0
+        self.dates = pd.DatetimeIndex(df.index)
+        self.columns = pd.Index(df.columns)
+        self._positions = {c: j for j, c in enumerate(self.columns)}
+        n, m = values.shape
+        self.sums = np.zeros((n + 1, m))
+        np.cumsum(np.where(positive, values, 0.0), axis=0, out=self.sums[1:])
+        self.counts = np.zeros((n + 1, m), dtype=np.int32)
+        np.cumsum(positive, axis=0, out=self.counts[1:])
+        has_sales = positive.any(axis=0)
+        days = self.dates.values.astype('datetime64[D]')
+        first = np.where(has_sales, positive.argmax(axis=0), 0)
+        last = np.where(has_sales, n - 1 - positive[::-1].argmax(axis=0), 0)
+        self.first = np.where(has_sales, days[first], np.datetime64('NaT'))
+        self.last = np.where(has_sales, days[last], np.datetime64('NaT'))
+
+    def _columns(self, global_ids):
+        if global_ids is None:
+            return slice(None), self.columns
+        global_ids = list(global_ids)
+        return [self._positions[c] for c in global_ids], pd.Index(global_ids)
+
+    def _rows(self, start, end):
+        """Prefix rows bounding the days in [start, end]."""
+        lo = self.dates.searchsorted(pd.Timestamp(start), side='left')
+        hi = self.dates.searchsorted(pd.Timestamp(end), side='right')
+        return lo, max(lo, hi)
+
+    def span(self, global_id):
+        """First and last day with sales of one dispensary, as Timestamps."""
+        j = self._positions[global_id]
+        return pd.Timestamp(self.first[j]), pd.Timestamp(self.last[j])
+
+    def totals(self, start, end, global_ids=None):
+        """Total sales between start and end, both included."""
+        cols, index = self._columns(global_ids)
+        lo, hi = self._rows(start, end)
+        return pd.Series(self.sums[hi, cols] - self.sums[lo, cols], index=index)
+
+    def sales_days(self, start, end, global_ids=None):
+        """Number of days with sales between start and end."""
+        cols, index = self._columns(global_ids)
+        lo, hi = self._rows(start, end)
+        return pd.Series(self.counts[hi, cols] - self.counts[lo, cols], index=index)
+
+    def active_days(self, start, end, global_ids=None):
+        """Calendar days between start and end inside every dispensary's span."""
+        cols, index = self._columns(global_ids)
+        lo = np.maximum(self.first[cols], np.datetime64(pd.Timestamp(start).date(), 'D'))
+        hi = np.minimum(self.last[cols], np.datetime64(pd.Timestamp(end).date(), 'D'))
+        days = (hi - lo).astype('timedelta64[D]').astype(np.float64) + 1
+        return pd.Series(np.where(np.isnan(days) | (days < 0), 0, days).astype(np.int64), index=index)
+
+    def averages(self, start, end, global_ids=None):
+        """Average daily sales between start and end over every dispensary's span."""
+        totals = self.totals(start, end, global_ids)
+        days = self.active_days(start, end, global_ids)
+        return totals / days.where(days > 0)
+
+    def table(self, start, end, global_ids=None):
+        """total/average/days comparison table of a group of dispensaries,
+        with % difference and percentile rank against the rest of the group.
+        """
+        totals = self.totals(start, end, global_ids)
+        averages = self.averages(start, end, global_ids).fillna(0.0)
+        return pd.DataFrame({
+            'total': totals,
+            'average': averages,
+            'sales_days': self.sales_days(start, end, global_ids),
+            'total_pct_diff': _pct_diff(totals.to_numpy()),
+            'total_percentile': _percentile(totals.to_numpy()),
+            'average_percentile': _percentile(averages.to_numpy()),
+            }, index=totals.index)
+
+
+def rollup_range(rollup, period, start, end, partial=None):
+    """Bins of a rollup that overlap [start, end].  Bins are labeled with
+    their last day, so this is a slice of the index, not a resample.  The
+    first and last bins can reach outside [start, end]; given partial(lo, hi),
+    the exact total between two days (see dispensary_rollup), those bins are
+    replaced by the total of their days inside the range.
+    """
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    offset = to_offset(RESAMPLE_RULES[period])
+    last_bin = offset.rollforward(end)
+    selected = rollup.loc[(rollup.index >= start) & (rollup.index <= last_bin)]
+    if partial is None or selected.empty:
+        return selected
+    selected = selected.copy()
+    for label in {selected.index[0], selected.index[-1]}:
+        first_day = label - offset + pd.Timedelta(days=1)
+        if first_day < start or label > end:
+            selected.loc[label] = partial(max(first_day, start), min(label, end))
+    return selected
+
+
+def dispensary_rollup(channel, period, global_id, start, end, store_dir=STORE_DIR):
+    """get_rollup cut to [start, end], with the edge bins holding only the
+    days inside the range.
+    """
+    index = get_rangeIndex(channel, store_dir)
+
+    def _partial(lo, hi):
+        if global_id not in index._positions:
+            return 0.0
+        return index.totals(lo, hi, [global_id])[global_id]
+    return rollup_range(get_rollup(channel, period, global_id, store_dir), period, start, end, _partial)
+
+
+def peer_rollup(channel, period, global_id, start, end, store_dir=STORE_DIR):
+    """PeerStats.peer_mean cut to [start, end], with the edge bins holding
+    only the days inside the range.
+    """
+    stats = peer_stats(channel, period, store_dir)
+    index = get_rangeIndex(channel, store_dir)
+    state = [c for c in stats.columns if c in index._positions]
+
+    def _partial(lo, hi):
+        totals = index.totals(lo, hi, state)
+        return (totals.sum() - totals.get(global_id, 0.0)) / (len(stats) - 1)
+    return rollup_range(stats.peer_mean(global_id), period, start, end, _partial)
+
+
+def daily_source(channel, store_dir=STORE_DIR):
+    """File whose changes invalidate the range index of a channel."""
+    path = os.path.join(matrix_dir(CHANNEL_FILES[channel], store_dir), "values.npy")
+    return path if os.path.exists(path) else CHANNEL_FILES[channel]
+
+
+def get_rangeIndex(channel, store_dir=STORE_DIR):
+    """Shared SalesRangeIndex of a channel, rebuilt when its daily table changes."""
+    def _build(path):
+        return SalesRangeIndex(get_salesColumns(CHANNEL_FILES[channel], store_dir=store_dir))
+    return cached_load(daily_source(channel, store_dir), _build, key=(channel, store_dir))
@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 17:20:14 2026
+
+@author: stark
+"""
+
+"""Headless comparison reports for every dispensary in the state.
+
+The figures the Dispensary Comparison page shows for one selection at a time
+are computed here for every dispensary, from the same rollups, peer tables
+and range index, and written as
+    <out_dir>/<global_id>.json   summary and the charted series
+    <out_dir>/<global_id>.html   summary table and plotly charts
+plus one row per dispensary in <out_dir>/index.csv.  Each summary holds the
+total, days with sales and average sales per period of every channel, and the
+total's % difference and percentile rank against the state and against the
+other dispensaries in the same city.
+
+Reports are built on a process pool; every worker loads the shared datasets
+once and writes its reports itself, and only the summary row travels back, so
+memory stays flat however many dispensaries there are.  Rows are taken as
+reports finish, in any order, and index.csv is written sorted by global_id
+once they are all done.
+    python sales_reports.py --out-dir reports --period Monthly --workers 4
+"""
+import argparse
+import csv
+import html
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from sales_data import get_licenseInfo
+from sales_ranges import dispensary_rollup, get_rangeIndex, peer_rollup
+from sales_rollups import CHANNEL_FILES, RESAMPLE_RULES
+from sales_store import STORE_DIR, get_salesCompanies
+
+REPORT_DIR = "reports"
+PERIOD = 'Monthly'
+FORMATS = ['html', 'json']
+INDEX_COLUMNS = ['global_id', 'name', 'city', 'first_date', 'last_date', 'total_sales', 'sales_days',
+                 'state_pct_diff', 'state_percentile', 'city_peers', 'city_pct_diff']
+
+
+def dispensary_table(store_dir=STORE_DIR):
+    """global_id/name/city of every dispensary with sales data."""
+    companies = get_salesCompanies("total_sales.csv", store_dir)
+    license_df = get_licenseInfo("Licensees_0.csv")[['global_id', 'name', 'city']]
+    license_df = license_df[license_df['global_id'].isin(companies)].drop_duplicates('global_id')
+    license_df['name'] = license_df['name'].astype(str).str.rstrip()
+    return license_df.reset_index(drop=True)
+
+
+def _channel_rollup(channel, period, global_id, start, end, store_dir):
+    """Rollup series of one dispensary cut to [start, end], empty if it has
+    no column in the channel.
+    """
+    try:
+        return dispensary_rollup(channel, period, global_id, start, end, store_dir)[global_id]
+    except KeyError:
+        return pd.Series(dtype=float)
+
+
+def dispensary_report(global_id, dispensaries, period=PERIOD, store_dir=STORE_DIR):
+    """Summary and chart series of one dispensary, as plain Python values.
+    dispensaries is the dispensary_table the state and city peers come from.
+    """
+    total_index = get_rangeIndex('total', store_dir)
+    start, end = total_index.span(global_id)
+    row = dispensaries.loc[dispensaries['global_id'] == global_id].iloc[0]
+    summary = {'global_id': global_id, 'name': row['name'], 'city': row['city'], 'period': period,
+               'first_date': str(start.date()), 'last_date': str(end.date())}
+    series = {}
+    for channel in CHANNEL_FILES:
+        index = get_rangeIndex(channel, store_dir)
+        rollup = _channel_rollup(channel, period, global_id, start, end, store_dir)
+        present = global_id in index._positions
+        summary[channel] = {
+            'total': float(index.totals(start, end, [global_id])[global_id]) if present else 0.0,
+            'sales_days': int(index.sales_days(start, end, [global_id])[global_id]) if present else 0,
+            'average': float(rollup.mean()) if len(rollup) else 0.0,
+            }
+        series[channel] = rollup
+    # comparisons over all the dates, the default range of the comparison page
+    first, last = total_index.dates[0], total_index.dates[-1]
+    state_table = total_index.table(first, last, dispensaries['global_id'])
+    summary['state'] = {
+        'dispensaries': len(state_table),
+        'peer_average_total': float((state_table['total'].sum() - state_table.loc[global_id, 'total'])
+                                    / (len(state_table) - 1)),
+        'total_pct_diff': float(state_table.loc[global_id, 'total_pct_diff']),
+        'total_percentile': float(state_table.loc[global_id, 'total_percentile']),
+        'average_percentile': float(state_table.loc[global_id, 'average_percentile']),
+        }
+    series['state_peer_mean'] = peer_rollup('total', period, global_id, start, end, store_dir)
+    # other dispensaries in the same city, like the Local (Same City) scope
+    city_ids = list(dispensaries.loc[dispensaries['city'] == row['city'], 'global_id'])
+    others = [c for c in city_ids if c != global_id]
+    city = {'dispensaries': len(city_ids), 'peer_average_total': None, 'total_pct_diff': None}
+    if others:
+        local_totals = total_index.totals(first, last, city_ids)
+        average_total = local_totals[others].mean()
+        city['peer_average_total'] = float(average_total)
+        if average_total > 0:
+            city['total_pct_diff'] = float((local_totals[global_id] - average_total) / average_total * 100)
+    summary['city_comparison'] = city
+    series['city_averages'] = pd.Series({c: _channel_rollup('total', period, c, start, end, store_dir).mean()
+                                         for c in city_ids})
+    return summary, series
+
+
+def report_json(summary, series):
+    def _points(s):
+        return [[str(k.date()) if hasattr(k, 'date') else str(k), None if pd.isna(v) else float(v)]
+                for k, v in s.items()]
+    return json.dumps({'summary': summary, 'series': {name: _points(s) for name, s in series.items()}})
+
+
+def _figure(traces, title, xaxis, yaxis):
+    """Plotly figure spec as a plain dict; plotly.express would rebuild a
+    frame and validate every property, which dominates the time of a report.
+    """
+    return {'data': traces,
+            'layout': {'title': {'text': title}, 'xaxis': {'title': {'text': xaxis}},
+                       'yaxis': {'title': {'text': yaxis}}}}
+
+
+def _line(s, name):
+    return {'type': 'scatter', 'mode': 'markers+lines', 'name': name,
+            'x': [str(k.date()) for k in s.index], 'y': [None if pd.isna(v) else float(v) for v in s]}
+
+
+def report_html(summary, series):
+    """Static page with the summary table and the comparison charts."""
+    import plotly.io as pio
+    period = summary['period']
+    city_averages = series['city_averages']
+    figures = [
+        _figure([_line(series[channel], channel.title()) for channel in CHANNEL_FILES],
+                "{0} Sales by Channel".format(period), "Date", "Total Sales, USD"),
+        _figure([_line(series['total'], summary['global_id']),
+                 _line(series['state_peer_mean'], 'All Other Dispensaries')],
+                "{0} Sales (Medical and Recreational) Comparison".format(period), "Date", "Total Sales, USD"),
+        _figure([{'type': 'bar', 'x': list(city_averages.index),
+                  'y': [None if pd.isna(v) else float(v) for v in city_averages],
+                  'marker': {'color': [None if pd.isna(v) else float(v) for v in city_averages]}}],
+                "Average {0} Sales in {1}".format(period, summary['city']), "Company Global Id",
+                "Average {} Sales (Medical and Recreational), USD".format(period)),
+        ]
+    rows = [("Dates", "{} to {}".format(summary['first_date'], summary['last_date']))]
+    for channel in CHANNEL_FILES:
+        rows += [("{} Sales".format(channel.title()), "${:,.2f}".format(summary[channel]['total'])),
+                 ("Average {} {} Sales".format(period, channel.title()), "${:,.2f}".format(summary[channel]['average'])),
+                 ("Days with {} Sales".format(channel.title()), summary[channel]['sales_days'])]
+    state, city = summary['state'], summary['city_comparison']
+    rows += [("Average Total Sales of the Other {} Dispensaries in the State".format(state['dispensaries'] - 1),
+              "${:,.2f}".format(state['peer_average_total'])),
+             ("% Difference vs. the State", "{:+.2f}%".format(state['total_pct_diff'])),
+             ("Statewide Percentile (Total / Average Daily Sales)",
+              "{:.0f} / {:.0f}".format(state['total_percentile'], state['average_percentile']))]
+    if city['total_pct_diff'] is not None:
+        rows += [("Average Total Sales of the Other {} Dispensaries in {}".format(city['dispensaries'] - 1, summary['city']),
+                  "${:,.2f}".format(city['peer_average_total'])),
+                 ("% Difference vs. {}".format(summary['city']), "{:+.2f}%".format(city['total_pct_diff']))]
+    table = "\n".join("<tr><th>{}</th><td>{}</td></tr>".format(html.escape(str(k)), html.escape(str(v)))
+                      for k, v in rows)
+    charts = "\n".join(pio.to_html(fig, full_html=False, include_plotlyjs='cdn' if i == 0 else False,
+                                    validate=False)
+                       for i, fig in enumerate(figures))
+    return ("<!DOCTYPE html>\n<html><head><meta charset=\"utf-8\"><title>{name} ({gid})</title></head>\n"
+            "<body>\n<h1>{name} ({gid}), {city}</h1>\n<table>\n{table}\n</table>\n{charts}\n</body></html>\n"
+            .format(name=html.escape(summary['name']), gid=summary['global_id'], city=html.escape(summary['city']),
+                    table=table, charts=charts))
+
+
+def _write(path, text):
+    with open(path + ".tmp", 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(path + ".tmp", path)
+
+
+def index_row(summary):
+    state, city = summary['state'], summary['city_comparison']
+    return [summary['global_id'], summary['name'], summary['city'], summary['first_date'], summary['last_date'],
+            round(summary['total']['total'], 2), summary['total']['sales_days'],
+            round(state['total_pct_diff'], 2), round(state['total_percentile'], 1),
+            city['dispensaries'] - 1, None if city['total_pct_diff'] is None else round(city['total_pct_diff'], 2)]
+
+
+def _report_task(task):
+    global_id, out_dir, period, formats, store_dir = task
+    dispensaries = _worker_dispensaries(store_dir)
+    summary, series = dispensary_report(global_id, dispensaries, period, store_dir)
+    path = os.path.join(out_dir, global_id)
+    if 'json' in formats:
+        _write(path + ".json", report_json(summary, series))
+    if 'html' in formats:
+        _write(path + ".html", report_html(summary, series))
+    return index_row(summary)
+
+
+_dispensaries = {}
+
+
+def _worker_dispensaries(store_dir):
+    if store_dir not in _dispensaries:
+        _dispensaries[store_dir] = dispensary_table(store_dir)
+    return _dispensaries[store_dir]
+
+
+def build_reports(out_dir=REPORT_DIR, period=PERIOD, global_ids=None, formats=FORMATS,
+                  store_dir=STORE_DIR, workers=None):
+    """Writes the reports of global_ids (default: every dispensary) to
+    out_dir on a process pool.  Returns (reports written, seconds).
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    if global_ids is None:
+        global_ids = list(dispensary_table(store_dir)['global_id'])
+    tasks = [(global_id, out_dir, period, formats, store_dir) for global_id in global_ids]
+    t0 = time.time()
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_report_task, task) for task in tasks]
+        for future in as_completed(futures):
+            rows.append(future.result())
+            if len(rows) % 50 == 0:
+                print("{} / {} reports, {:.1f} dispensaries/s".format(len(rows), len(tasks),
+                                                                      len(rows) / (time.time() - t0)))
+    rows.sort(key=lambda row: row[0])
+    with open(os.path.join(out_dir, "index.csv"), 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(INDEX_COLUMNS)
+        writer.writerows(rows)
+    return len(rows), time.time() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write the comparison report of every dispensary as static HTML/JSON.")
+    parser.add_argument("--out-dir", default=REPORT_DIR)
+    parser.add_argument("--period", choices=list(RESAMPLE_RULES), default=PERIOD)
+    parser.add_argument("--ids", nargs='+', help="global_ids to report on, default every dispensary")
+    parser.add_argument("--formats", nargs='+', choices=FORMATS, default=FORMATS)
+    parser.add_argument("--store-dir", default=STORE_DIR)
+    parser.add_argument("--workers", type=int)
+    args = parser.parse_args()
+    done, seconds = build_reports(args.out_dir, args.period, args.ids, args.formats, args.store_dir, args.workers)
+    print("Wrote {} reports to {} in {:.1f}s ({:.1f} dispensaries/s)".format(done, args.out_dir, seconds,
+                                                                           done / seconds if seconds else 0.0))
+
+
+if __name__ == "__main__":
+    main()
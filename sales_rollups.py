@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 08:02:19 2026
+
+@author: stark
+"""
+
+"""Precomputed Daily/Weekly/Monthly/Quarterly/Yearly rollups of the sales tables.
+
+The pages used to run
+    sales_df.query("`<global_id>` > 0")[global_id].resample(rule).sum()
+on every rerun.  The build step below does that for every dispensary and every
+channel at once: non-positive days are zeroed, the whole matrix is resampled,
+and the first/last bin holding a positive day is recorded per dispensary as
+its span.  Slicing a rollup column to its span gives the same series as the
+query + resample above, so a lookup is a dictionary hit plus one slice of a
+memory-mapped column.
+
+Build the rollups (after sales_store.py) with:
+    python sales_rollups.py [--store-dir sales_store]
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from sales_data import cached_load
+from sales_store import STORE_DIR, SalesMatrix, get_salesColumns, matrix_dir, write_salesMatrix
+
+RESAMPLE_RULES = {'Daily': 'D', 'Weekly': 'W', 'Monthly': 'M', 'Quarterly': 'Q',
+                  'Yearly': 'Y'}
+CHANNEL_FILES = {'total': "total_sales.csv",
+                 'medical': "medical_sales.csv",
+                 'recreational': "recreational_sales.csv"}
+
+
+def rollup_dir(channel, period, store_dir=STORE_DIR):
+    return os.path.join(store_dir, "rollups", "{}_{}".format(channel, RESAMPLE_RULES[period]))
+
+
+def resample_positive(df, rule):
+    """Resamples every column of a daily sales frame the way the pages do.
+    Returns the resampled frame and an (n_columns, 2) array of [start, end)
+    bin positions outside of which a column has no positive sales.
+    """
+    positive = df > 0
+    rollup = df.where(positive, 0.0).resample(rule).sum()
+    active = positive.resample(rule).max().to_numpy(dtype=bool)
+    n_bins = active.shape[0]
+    has_sales = active.any(axis=0)
+    start = np.where(has_sales, active.argmax(axis=0), 0)
+    end = np.where(has_sales, n_bins - active[::-1].argmax(axis=0), 0)
+    return rollup, np.column_stack([start, end]).astype(np.int64)
+
+
+def build_rollups(store_dir=STORE_DIR, verbose=True):
+    """Writes every channel x period rollup into the store."""
+    for channel, filename in CHANNEL_FILES.items():
+        df = get_salesColumns(filename, store_dir=store_dir)
+        for period, rule in RESAMPLE_RULES.items():
+            rollup, spans = resample_positive(df, rule)
+            out_dir = rollup_dir(channel, period, store_dir)
+            write_salesMatrix(rollup, out_dir, arrays={'spans': spans})
+            if verbose:
+                print("{} {} -> {}".format(channel, period, out_dir))
+
+
+class RollupMatrix(SalesMatrix):
+    """SalesMatrix of one channel/period rollup plus the span of every column."""
+    def __init__(self, path):
+        super().__init__(path)
+        self.spans = np.load(os.path.join(path, "spans.npy"))
+
+    def series(self, global_id):
+        j = self.positions([global_id])[0]
+        start, end = self.spans[j]
+        return pd.Series(self.values[start:end, j], index=self.dates[start:end],
+                         name=global_id, copy=False)
+
+
+def _load_rollupMatrix(values_path):
+    return RollupMatrix(os.path.dirname(values_path))
+
+
+def open_rollup(channel, period, store_dir=STORE_DIR):
+    """Shared RollupMatrix, or None if the rollups have not been built."""
+    path = os.path.join(rollup_dir(channel, period, store_dir), "values.npy")
+    if not os.path.exists(path):
+        return None
+    return cached_load(path, _load_rollupMatrix)
+
+
+def rollup_source(channel, period, store_dir=STORE_DIR):
+    """File whose changes invalidate anything derived from a rollup."""
+    for path in (os.path.join(rollup_dir(channel, period, store_dir), "values.npy"),
+                 os.path.join(matrix_dir(CHANNEL_FILES[channel], store_dir), "values.npy")):
+        if os.path.exists(path):
+            return path
+    return CHANNEL_FILES[channel]
+
+
+def load_rollupArrays(channel, period, store_dir=STORE_DIR):
+    """(dates, columns, values, spans) of a whole rollup, resampling on the
+    fly when the rollups have not been built.
+    """
+    matrix = open_rollup(channel, period, store_dir)
+    if matrix is not None:
+        return matrix.dates, matrix.columns, matrix.values, matrix.spans
+    df = get_salesColumns(CHANNEL_FILES[channel], store_dir=store_dir)
+    rollup, spans = resample_positive(df, RESAMPLE_RULES[period])
+    return rollup.index, rollup.columns, rollup.to_numpy(), spans
+
+
+def get_rollup(channel, period, global_id, store_dir=STORE_DIR):
+    """Resampled sales of one dispensary as a single column frame, e.g.
+        get_rollup('medical', 'Weekly', company_id)
+    matches
+        medicalSales_df.query("`<company_id>` > 0")[company_id].resample('W').sum().to_frame()
+    Resamples on the fly when the rollups have not been built.
+    """
+    matrix = open_rollup(channel, period, store_dir)
+    if matrix is None:
+        df = get_salesColumns(CHANNEL_FILES[channel], [global_id], store_dir=store_dir)
+        query_string = "`" + str(global_id) + "` > 0"
+        return df.query(query_string)[global_id].resample(RESAMPLE_RULES[period]).sum().to_frame()
+    return matrix.series(global_id).to_frame()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute the resampled sales rollups.")
+    parser.add_argument("--store-dir", default=STORE_DIR)
+    args = parser.parse_args()
+    build_rollups(args.store_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 07:31:40 2026
+
+@author: stark
+"""
+
+"""Columnar, memory-mapped storage for the wide date x dispensary sales tables.
+
+Each table is written to its own directory in the store:
+    dates.npy       shared sold_at index (datetime64[ns])
+    columns.json    global_id of every column, in storage order
+    values.npy      float64 matrix in column-major (Fortran) order, so every
+                    dispensary is one contiguous run of bytes on disk
+
+values.npy is opened with mmap_mode='r', so only the pages of the columns that
+are actually requested are read from disk.
+
+Build the store with:
+    python sales_store.py [--store-dir sales_store] [csv files...]
+"""
+import argparse
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from sales_data import SALES_FILES, cached_load, load_salesData
+from sales_ragged import get_raggedSales
+
+STORE_DIR = "sales_store"
+
+
+def matrix_dir(filename, store_dir=STORE_DIR):
+    """Directory of the store entry for a sales .csv file."""
+    name = os.path.splitext(os.path.basename(filename))[0]
+    return os.path.join(store_dir, name)
+
+
+def write_salesMatrix(df, out_dir, arrays=None):
+    """Writes a sold_at-indexed frame to out_dir in the columnar format.
+    The entry is built next to out_dir and swapped in once complete, so a
+    running app never sees a half-written matrix.  Any extra arrays given as
+    {name: array} are saved alongside as <name>.npy.
+    """
+    tmp_dir = out_dir.rstrip(os.sep) + ".tmp"
+    if os.path.isdir(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    os.makedirs(tmp_dir)
+    np.save(os.path.join(tmp_dir, "dates.npy"), df.index.values.astype('datetime64[ns]'))
+    with open(os.path.join(tmp_dir, "columns.json"), 'w') as f:
+        json.dump([str(c) for c in df.columns], f)
+    for name, array in (arrays or {}).items():
+        np.save(os.path.join(tmp_dir, name + ".npy"), array)
+    np.save(os.path.join(tmp_dir, "values.npy"), np.asfortranarray(df.to_numpy(dtype=np.float64)))
+    if os.path.isdir(out_dir):
+        shutil.rmtree(out_dir)
+    os.replace(tmp_dir, out_dir)
+
+
+def convert_salesData(filename, store_dir=STORE_DIR):
+    """Converts one wide sales .csv file into the store."""
+    out_dir = matrix_dir(filename, store_dir)
+    write_salesMatrix(load_salesData(filename), out_dir)
+    return out_dir
+
+
+class SalesMatrix:
+    """Read-only, memory-mapped view of one converted sales table."""
+    def __init__(self, path):
+        self.path = path
+        self.values = np.load(os.path.join(path, "values.npy"), mmap_mode='r')
+        self.dates = pd.DatetimeIndex(np.load(os.path.join(path, "dates.npy")), name='sold_at')
+        with open(os.path.join(path, "columns.json")) as f:
+            self.columns = pd.Index(json.load(f))
+        self._positions = {c: i for i, c in enumerate(self.columns)}
+
+    def __contains__(self, global_id):
+        return global_id in self._positions
+
+    def positions(self, global_ids):
+        missing = [c for c in global_ids if c not in self._positions]
+        if missing:
+            raise KeyError("{} not in {}".format(missing, self.path))
+        return [self._positions[c] for c in global_ids]
+
+    def column(self, global_id):
+        """Sales series of one dispensary, backed directly by the memory map."""
+        j = self.positions([global_id])[0]
+        return pd.Series(self.values[:, j], index=self.dates, name=global_id, copy=False)
+
+    def frame(self, global_ids=None):
+        """Same layout as load_salesData, restricted to the requested columns."""
+        if global_ids is None:
+            return pd.DataFrame(self.values, index=self.dates, columns=self.columns, copy=False)
+        global_ids = list(global_ids)
+        return pd.DataFrame(self.values[:, self.positions(global_ids)], index=self.dates,
+                            columns=pd.Index(global_ids), copy=False)
+
+
+def _load_salesMatrix(values_path):
+    return SalesMatrix(os.path.dirname(values_path))
+
+
+def open_salesMatrix(filename, store_dir=STORE_DIR):
+    """Shared SalesMatrix for a sales .csv file, or None if it is not converted."""
+    path = os.path.join(matrix_dir(filename, store_dir), "values.npy")
+    if not os.path.exists(path):
+        return None
+    return cached_load(path, _load_salesMatrix)
+
+
+def get_salesCompanies(filename, store_dir=STORE_DIR):
+    """global_ids available in a sales table, without reading the values."""
+    matrix = open_salesMatrix(filename, store_dir)
+    if matrix is None:
+        return get_raggedSales(filename).columns
+    return matrix.columns
+
+
+def get_salesColumns(filename, global_ids=None, store_dir=STORE_DIR):
+    """Drop-in replacement for load_salesData that only reads the requested
+    global_id columns.  When the store has not been built the .csv file is
+    kept in memory as a RaggedSales table, and the requested columns are
+    expanded from it.
+    """
+    matrix = open_salesMatrix(filename, store_dir)
+    if matrix is None:
+        return get_raggedSales(filename).frame(global_ids)
+    return matrix.frame(global_ids)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert the wide sales .csv files to the columnar store.")
+    parser.add_argument("files", nargs='*', default=SALES_FILES)
+    parser.add_argument("--store-dir", default=STORE_DIR)
+    args = parser.parse_args()
+    for filename in args.files:
+        print("{} -> {}".format(filename, convert_salesData(filename, args.store_dir)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 09:14:36 2026
+
+@author: stark
+"""
+
+"""Grid index over the geocoded dispensaries for radius and nearest-neighbor queries.
+
+Points are bucketed into cell_deg x cell_deg cells and stored sorted by cell
+key (lat row * LON_CELLS + lon column).  The cells of one latitude row that
+overlap a query's bounding box are then one contiguous slice of the sorted
+keys, so gathering candidates is two searchsorted calls per row instead of a
+scan of the whole table.  Candidates are filtered by exact haversine distance.
+"""
+import numpy as np
+
+from sales_data import cached_load, get_dispensaryInfo
+
+EARTH_RADIUS_MILES = 3958.8
+MILES_PER_DEGREE = 69.09
+
+
+def haversine(lat, lon, lats, lons):
+    """Great-circle distance in miles from (lat, lon) to arrays of points, all in degrees."""
+    lat, lon = np.radians(lat), np.radians(lon)
+    lats, lons = np.radians(lats), np.radians(lons)
+    a = np.sin((lats - lat) / 2)**2 + np.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2)**2
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class DispensaryIndex:
+    """Spatial index of dispensary locations.
+    Parameters
+    ----------
+    global_ids:
+        id of every dispensary.
+    lat, lon:
+        location of every dispensary in degrees; rows with a missing
+        location are left out of the index.
+    cell_deg:
+        size of a grid cell in degrees.
+    """
+    def __init__(self, global_ids, lat, lon, cell_deg=0.25):
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        valid = np.isfinite(lat) & np.isfinite(lon)
+        self.cell_deg = cell_deg
+        self.lon_cells = int(np.ceil(360 / cell_deg)) + 1
+        keys = self._rows(lat[valid]) * self.lon_cells + self._cols(lon[valid])
+        order = np.argsort(keys, kind='stable')
+        self.keys = keys[order]
+        self.global_ids = np.asarray(global_ids)[valid][order]
+        self.lat = lat[valid][order]
+        self.lon = lon[valid][order]
+
+    @classmethod
+    def from_frame(cls, df, cell_deg=0.25):
+        return cls(df['global_id'].to_numpy(), df['Lat'].to_numpy(), df['Lon'].to_numpy(), cell_deg)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _rows(self, lat):
+        return np.floor((np.clip(lat, -90, 90) + 90) / self.cell_deg).astype(np.int64)
+
+    def _cols(self, lon):
+        return np.floor((np.mod(lon + 180, 360)) / self.cell_deg).astype(np.int64)
+
+    def _candidates(self, lat, lon, radius):
+        """Positions of the points in the cells overlapping the query's bounding box."""
+        dlat = radius / MILES_PER_DEGREE
+        widest = np.cos(np.radians(min(abs(lat) + dlat, 90.0)))
+        dlon = dlat / widest if widest > 1e-9 else 360.0
+        if dlon >= 180 or not (-180 <= lon - dlon and lon + dlon < 180):
+            # box wraps around the globe, every column of the rows qualifies
+            col0, col1 = 0, self.lon_cells - 1
+        else:
+            col0, col1 = self._cols(lon - dlon), self._cols(lon + dlon)
+        rows = np.arange(self._rows(lat - dlat), self._rows(lat + dlat) + 1)
+        lo = np.searchsorted(self.keys, rows * self.lon_cells + col0, side='left')
+        hi = np.searchsorted(self.keys, rows * self.lon_cells + col1, side='right')
+        spans = [np.arange(a, b) for a, b in zip(lo, hi) if b > a]
+        return np.concatenate(spans) if spans else np.empty(0, dtype=np.int64)
+
+    def within(self, lat, lon, radius):
+        """global_ids and distances (miles) of every dispensary within radius
+        miles of (lat, lon), nearest first.
+        """
+        idx = self._candidates(lat, lon, radius)
+        dist = haversine(lat, lon, self.lat[idx], self.lon[idx])
+        keep = dist <= radius
+        idx, dist = idx[keep], dist[keep]
+        order = np.argsort(dist, kind='stable')
+        return self.global_ids[idx[order]], dist[order]
+
+    def nearest(self, lat, lon, k):
+        """global_ids and distances (miles) of the k dispensaries nearest to (lat, lon)."""
+        k = min(k, len(self))
+        radius = self.cell_deg * MILES_PER_DEGREE
+        while True:
+            ids, dist = self.within(lat, lon, radius)
+            # every point outside the radius is farther than the k found inside it
+            if len(ids) >= k or radius > np.pi * EARTH_RADIUS_MILES:
+                return ids[:k], dist[:k]
+            radius *= 2
+
+
+def _load_dispensaryIndex(path):
+    return DispensaryIndex.from_frame(get_dispensaryInfo(path))
+
+
+def get_dispensaryIndex(filename="dispensary_info.csv"):
+    """Shared DispensaryIndex over the geocoded dispensary table."""
+    return cached_load(filename, _load_dispensaryIndex)
@@ -7,8 +7,52 @@ Created on Sun May 16 16:47:56 2021
 
 """Frameworks for running multiple Streamlit applications as a single app.
 """
+import importlib
+import os
+import threading
+import time
+
 import streamlit as st
 
+import page_metrics
+
+# set to 0 to skip the background cache warmup
+WARMUP = os.environ.get("TDI_WARMUP", "1") not in ("", "0")
+_loaded_at = time.perf_counter()
+_first_render = None
+_warmup_lock = threading.Lock()
+_warmup_started = False
+
+
+def _resolve(func):
+    """Function for a "module:function" name, imported on first use."""
+    if not isinstance(func, str):
+        return func
+    module, name = func.split(":")
+    return getattr(importlib.import_module(module), name)
+
+
+def _warmup(func, instrument):
+    t0 = time.perf_counter()
+    try:
+        _resolve(func)()
+    except Exception as err:
+        page_metrics.log_event('warmup', seconds=time.perf_counter() - t0, error=repr(err))
+        return
+    if instrument:
+        page_metrics.log_event('warmup', seconds=time.perf_counter() - t0)
+
+
+def start_warmup(func, instrument=False):
+    """Runs func once per process in a daemon thread."""
+    global _warmup_started
+    with _warmup_lock:
+        if _warmup_started:
+            return
+        _warmup_started = True
+    threading.Thread(target=_warmup, args=(func, instrument), name="cache-warmup", daemon=True).start()
+
+
 class MultiApp:
     """Framework for combining multiple streamlit applications.
     Usage:
@@ -27,16 +71,30 @@ class MultiApp:
         app.add_app("Foo", foo.app)
         app.add_app("Bar", bar.app)
         app.run()
+    Apps can also be registered by name, the module is then only imported
+    the first time the app is selected.
+        app.add_app("Foo", "foo:app")
+    Page runs are timed when instrument is True (default: the TDI_METRICS
+    environment variable), see page_metrics.py; debug_panel shows the
+    timings in the sidebar.
     """
-    def __init__(self):
+    def __init__(self, instrument=None, debug_panel=None):
         self.apps = []
+        if debug_panel is None:
+            debug_panel = page_metrics.DEBUG_PANEL
+        if instrument is None:
+            instrument = page_metrics.ENABLED or debug_panel
+        self.instrument = instrument
+        self.debug_panel = debug_panel
+        self.warmup = None
 
     def add_app(self, title, func):
         """Adds a new application.
         Parameters
         ----------
         func:
-            the python function to render this app.
+            the python function to render this app, or its "module:function"
+            name to import it when the app is first selected.
         title:
             title of the app. Appears in the dropdown in the sidebar.
         """
@@ -45,10 +103,40 @@ class MultiApp:
             "function": func
         })
 
+    def add_warmup(self, func):
+        """Sets a function (or "module:function" name) that fills the data
+        caches.  It runs once per process in a background thread, after the
+        first page has rendered.
+        """
+        self.warmup = func
+
     def run(self):
         app = st.sidebar.radio(
             'Go To',
             self.apps,
             format_func=lambda app: app['title'])
 
-        app['function']()
\ No newline at end of file
+        run = None
+        if not self.instrument:
+            _resolve(app['function'])()
+        else:
+            page_metrics.start_run(app['title'])
+            completed = False
+            try:
+                _resolve(app['function'])()
+                completed = True
+            finally:
+                run = page_metrics.end_run(completed)
+        self._after_render()
+        if self.debug_panel:
+            page_metrics.debug_panel(run, _first_render)
+
+    def _after_render(self):
+        global _first_render
+        if _first_render is None:
+            # time from the first script run to the end of the first page
+            _first_render = time.perf_counter() - _loaded_at
+            if self.instrument:
+                page_metrics.log_event('startup', seconds=_first_render)
+        if self.warmup is not None and WARMUP:
+            start_warmup(self.warmup, self.instrument)
\ No newline at end of file
@@ -5,37 +5,31 @@ Created on Sun May 16 16:50:07 2021
 @author: stark
 """
 import streamlit as st
-import pandas as pd
-import numpy as np
-import plotly.express as px
-from streamlit_folium import folium_static
-import folium
-
-def load_salesData(filename):
-    df = pd.read_csv(filename)
-    df['sold_at'] = df['sold_at'].astype('datetime64[ns]')
-    df = df.set_index('sold_at')
-    return df
+from page_metrics import stage
+# pandas, plotly, folium and the sales modules are imported by the pages that
+# use them, so the app starts and renders the Homepage without loading them
 
 def homepage_app():
+    from sales_data import get_licenseInfo
+    from sales_store import get_salesCompanies
     st.title("Washington State Cannabis Analytics")
     st.header("TDI Spring Cohort 2021")
     st.subheader("Jeffrey Kwarsick, PhD")
     # open the licensees .csv file
     license_info = "Licensees_0.csv"
-    totalSales_df = load_salesData("total_sales.csv")
-    companies = totalSales_df.columns
+    companies = get_salesCompanies("total_sales.csv")
     
     
-    license_df = pd.read_csv(license_info)
+    license_df = get_licenseInfo(license_info)
     # keep only some information for now
     license_df = license_df[['global_id', 'name', 'address1', 'address2', 'city']]
     # keep only processed companies in the list
     license_df = license_df[license_df["global_id"].isin(companies)]
+    stage("load")
     st.subheader("Project Description")
     st.write("[Github Repository Link](https://github.com/jtkwar/TDI_2021_CapstoneProject)")
     st.write("Analysis and Comparison of {0} Dispensaries in the State of Washington between January 1, 2018 and December 31, 2020.".format(len(companies)))
-    st.write("This project aims to provide insight into the performance of different cannabis dispensaries across the State of Washington.  The 'Select Company' page allows for an in-depth look of sales data for an individual dispensary.  The 'Company Comparison' page allows one to compare the performance of one dispensary against others in the same city or all dispensaries in the state.")
+    st.write("This project aims to provide insight into the performance of different cannabis dispensaries across the State of Washington.  The 'Select Company' page allows for an in-depth look of sales data for an individual dispensary, including a seasonal forecast of its sales.  The 'Company Comparison' page allows one to compare the performance of one dispensary against others in the same city, within an adjustable radius, or all dispensaries in the state.")
     st.subheader("Process")
     st.markdown("""
                 - Data was obtained from the [Washington State Liquor and Cannabis Board](https://lcb.wa.gov/), an agency responsible for promoting public safety and trust through fair administration and enforcement of liquor, cannabis, tabacco, and vapor laws. [Link to Data](https://lcb.app.box.com/s/fnku9nr22dhx04f6o646xv6ad6fswfy9?page=1)
@@ -53,10 +47,7 @@ def homepage_app():
     st.subheader("Future Plans")
     st.markdown("""
                 - Complete extraction of sales data for all dispensaries located in the State of Washington.
-                - Build predictive capabilities utilizing sales data for each dispensary
-                - Move from city and state comparison to an adjustable radius for dispensary comparison.
                 - Expand analysis to specific products and product types
-                - Add selectable date range
                 """)
     st.subheader('Things to Watch Out For')
     st.write("There are still some errors in the geocoding of address to (Latitude, Longitude) that could result in inproper location of the dispensary.  I am currently working on sorting that out.")
@@ -65,17 +56,23 @@ def homepage_app():
     
     
 def single_company_stats():
+    import pandas as pd
+    import plotly.express as px
+    from sales_data import get_licenseInfo
+    from sales_store import get_salesCompanies
+    from sales_rollups import get_rollup, rollup_source
+    from sales_ranges import dispensary_rollup, get_rangeIndex
+    from sales_forecast import get_forecast, open_forecast
+    from chart_data import cached_figure, line_figure
     ### load the data ###
     license_info = "Licensees_0.csv"
-    license_df = pd.read_csv(license_info)
+    license_df = get_licenseInfo(license_info)
     # keep only some information for now
     license_df = license_df[['global_id', 'name', 'address1', 'address2', 'city']]
-    totalSales_df = load_salesData("total_sales.csv")
-    recreationalSales_df = load_salesData("recreational_sales.csv")
-    medicalSales_df = load_salesData("medical_sales.csv")
-    companies = totalSales_df.columns
+    companies = get_salesCompanies("total_sales.csv")
     # collapse the licensees dataframe to what is currently parsed
     license_df = license_df[license_df["global_id"].isin(companies)]
+    stage("load")
     
     ######################################################################################
     ######################################################################################
@@ -90,6 +87,7 @@ def single_company_stats():
         company_id = st.selectbox("Select Dispensary Id", list(license_df.query("city == @city & name == @company")['global_id']))
     # return selected company information
     st.table(license_df.loc[license_df['name'] == str(company)])
+    stage("select")
     #st.table(totalSales_df)
     ######################################################################################
     ######################################################################################
@@ -98,50 +96,43 @@ def single_company_stats():
                      'Yearly': 'Y'}
     st.header("Sales Data Summary for {}".format(company.rstrip()))
     tp_selection = st.selectbox("Select Time Period Sampling", list(resample_dict.keys()))
+    total_index = get_rangeIndex('total')
+    min_date, max_date = date_range_picker(*total_index.span(company_id))
     ######################################################################################
-    query_string = "`" + str(company_id) + "` > 0"
-    
-    medicalSales = medicalSales_df.query(query_string)[str(company_id)].resample(resample_dict[tp_selection]).sum().to_frame()
-    recreationalSales = recreationalSales_df.query(query_string)[str(company_id)].resample(resample_dict[tp_selection]).sum().to_frame()
-    totalSales = totalSales_df.query(query_string)[str(company_id)].resample(resample_dict[tp_selection]).sum().to_frame()
-    min_date = pd.to_datetime(totalSales.index.values.min())
-    max_date = pd.to_datetime(totalSales.index.values.max())
+    # precomputed rollups, see sales_rollups.py, cut to the selected dates
+    medicalSales = dispensary_rollup('medical', tp_selection, company_id, min_date, max_date)
+    recreationalSales = dispensary_rollup('recreational', tp_selection, company_id, min_date, max_date)
+    totalSales = dispensary_rollup('total', tp_selection, company_id, min_date, max_date)
+    # range totals are two lookups in the prefix-sum index, see sales_ranges.py
     st.write("Total Sales Between {0} to {1}: ${2:,.2f}".format(min_date.date(),
                                                                 max_date.date(),
-                                                                totalSales.sum()[0]))
+                                                                total_index.totals(min_date, max_date, [company_id])[company_id]))
+    st.write("Days with Sales: {0} of {1}".format(total_index.sales_days(min_date, max_date, [company_id])[company_id],
+                                                  (max_date - min_date).days + 1))
     st.write("Average {0} Total Sales (Medical and Recreational): ${1:,.2f}".format(tp_selection, totalSales[str(company_id)].mean()))
     st.write("Average {0} Medical Sales: ${1:,.2f}".format(tp_selection, medicalSales[str(company_id)].mean()))
     st.write("Average {0} Recreational Sales: ${1:,.2f}".format(tp_selection, recreationalSales[str(company_id)].mean()))
+    stage("summary")
     
     st.header("Sales Data Visualization")
     scol1, scol2, scol3 = st.beta_columns((1, 1, 1))
     if tp_selection == 'Daily' or tp_selection == 'Weekly' or tp_selection == 'Monthly':
+        # downsampled to the point budget and cached per selection, see chart_data.py
+        chart_key = (company_id, tp_selection, min_date, max_date)
         with scol1:
-            f = px.line(totalSales,
-                        x=totalSales.index,
-                        y=totalSales.iloc[:,0],
-                        title="{0} Sales (Medical and Recreational)".format(tp_selection))
-            f.update_traces(mode="markers+lines")
-            f.update_xaxes(title="Date")
-            f.update_yaxes(title="Total Sales, USD")
+            f = cached_figure(('total',) + chart_key, rollup_source('total', tp_selection),
+                              lambda: line_figure(totalSales, "{0} Sales (Medical and Recreational)".format(tp_selection),
+                                                  "Date", "Total Sales, USD"))
             st.plotly_chart(f)
         with scol2:
-            g = px.line(medicalSales,
-                        x=medicalSales.index,
-                        y=medicalSales.iloc[:,0],
-                        title="{0} Medical Retail Sales".format(tp_selection))        
-            g.update_traces(mode="markers+lines")
-            g.update_xaxes(title="Date")
-            g.update_yaxes(title="Total Sales, USD")            
+            g = cached_figure(('medical',) + chart_key, rollup_source('medical', tp_selection),
+                              lambda: line_figure(medicalSales, "{0} Medical Retail Sales".format(tp_selection),
+                                                  "Date", "Total Sales, USD"))
             st.plotly_chart(g)
         with scol3:
-            h = px.line(recreationalSales,
-                        x=recreationalSales.index,
-                        y=recreationalSales.iloc[:,0],
-                        title="{0} Recreational Retail Sales".format(tp_selection))        
-            h.update_traces(mode="markers+lines")
-            h.update_xaxes(title="Date")
-            h.update_yaxes(title="Total Sales, USD")            
+            h = cached_figure(('recreational',) + chart_key, rollup_source('recreational', tp_selection),
+                              lambda: line_figure(recreationalSales, "{0} Recreational Retail Sales".format(tp_selection),
+                                                  "Date", "Total Sales, USD"))
             st.plotly_chart(h)
     else:
         with scol1:
@@ -163,24 +154,60 @@ def single_company_stats():
             h.update_yaxes(title="Total Sales, USD")
             st.plotly_chart(h)
 
+    stage("charts")
+    st.header("Sales Forecast")
+    if tp_selection == 'Quarterly' or tp_selection == 'Yearly':
+        st.write("Forecasts are available for Daily, Weekly and Monthly sampling.")
+    else:
+        # fitted offline for every dispensary at once, see sales_forecast.py
+        totalForecast = get_forecast('total', tp_selection, company_id)
+        if totalForecast.empty or not (totalForecast['forecast'] > 0).any():
+            st.write("No forecast is available for {}; it has no recent sales to forecast from.".format(company.rstrip()))
+        else:
+            totalHistory = get_rollup('total', tp_selection, company_id)
+            totalHistory = totalHistory[totalHistory.index > totalHistory.index.max() - pd.Timedelta(days=365)]
+            # the first forecast bin already holds the sales of its days in the data
+            totalHistory = totalHistory[totalHistory.index < totalForecast.index[0]]
+            forecast_df = pd.concat([totalHistory.rename(columns={company_id: 'Total Sales'}),
+                                     totalForecast.rename(columns={'forecast': 'Forecast',
+                                                                   'lower': 'Lower 95%',
+                                                                   'upper': 'Upper 95%'})], axis=1)
+            forecastEnd = totalForecast.index[-1]
+            st.write("Forecast Total Sales Through {0}: ${1:,.2f}".format(forecastEnd.date(),
+                     open_forecast('total').band(company_id)['forecast'].loc[:forecastEnd].sum()))
+            fc = px.line(forecast_df, x=forecast_df.index, y=forecast_df.columns,
+                         title="{0} Sales (Medical and Recreational) Forecast".format(tp_selection))
+            fc.update_traces(mode="lines")
+            fc.update_xaxes(title="Date")
+            fc.update_yaxes(title="Total Sales, USD")
+            st.plotly_chart(fc)
+    stage("forecast")
+
 
 
 
 def company_comparison():
+    import pandas as pd
+    from streamlit_folium import folium_static
+    from sales_data import get_licenseInfo, get_dispensaryInfo
+    from sales_store import get_salesCompanies
+    from sales_rollups import rollup_source
+    from spatial_index import get_dispensaryIndex
+    from map_layers import cached_markerPayload, dispensary_map
+    from sales_ranges import dispensary_rollup, get_rangeIndex, peer_rollup
+    from chart_data import cached_figure, line_figure
     st.title("Dispensary Comparison")
     ### load the data ###
     license_info = "Licensees_0.csv"
-    license_df = pd.read_csv(license_info)
+    license_df = get_licenseInfo(license_info)
     # keep only some information for now
     license_df = license_df[['global_id', 'name', 'address1', 'address2', 'city']]
-    dispensary_info = pd.read_csv("dispensary_info.csv")
+    dispensary_info = get_dispensaryInfo("dispensary_info.csv")
     dispensary_info = dispensary_info[['global_id', 'name', 'address1', 'address2', 'city', 'main-address', 'Lat', 'Lon']]
-    totalSales_df = load_salesData("total_sales.csv")
-    recreationalSales_df = load_salesData("recreational_sales.csv")
-    medicalSales_df = load_salesData("medical_sales.csv")
-    companies = totalSales_df.columns
+    companies = get_salesCompanies("total_sales.csv")
     # collapse the licensees dataframe to what is currently parsed
     license_df = license_df[license_df["global_id"].isin(companies)]
+    stage("load")
     ######################################################################################
     ######################################################################################
     st.header("Select Dispensary for Comparison")
@@ -193,9 +220,10 @@ def company_comparison():
         company_id = st.selectbox("Select Dispensary Id", list(license_df.query("city == @city & name == @company")['global_id']))
     # return selected company information
     st.table(dispensary_info.loc[dispensary_info['name'] == str(company)])
+    stage("select")
     ######################################################################################
     ######################################################################################
-    scope = st.selectbox("Scope of Comparison", ['Statewide', 'Local (Same City)'])
+    scope = st.selectbox("Scope of Comparison", ['Statewide', 'Local (Same City)', 'Within Radius'])
     
     if scope == 'Statewide':
         st.subheader("Comparison of {0} ({1}) Performance Against All Dispensaries in the State".format(company, company_id))
@@ -204,46 +232,37 @@ def company_comparison():
         dispensary_selected = dispensary_info[dispensary_info['global_id'] == company_id]
         dispensaries_other  = dispensary_info[dispensary_info["global_id"] != company_id]
         st.write('The selected dispensary for comparison is shown on the map with a blue marker.  All other dispensaries are shown on the map with red markers.')
-        # initialize folium map, center on dispensary selected
-        m = folium.Map(location=[dispensary_selected['Lat'], dispensary_selected['Lon']], zoom_start=10)
-        tooltip = company
-        # place chosen dispensary on map with a marker
-        folium.Marker([dispensary_selected['Lat'], dispensary_selected['Lon']], popup=company, tooltip=tooltip).add_to(m)
-        # place markers for the other dispensaries in the same town, using different marker to distinguish
-        other_map_df = dispensaries_other[dispensaries_other['global_id'] != company_id]
-        for i in range(len(other_map_df)):
-            folium.Marker(
-                location = [other_map_df.iloc[i]['Lat'], other_map_df.iloc[i]['Lon']],
-                popup=other_map_df.iloc[i]['name'],
-                icon=folium.Icon(color="red")
-                ).add_to(m)
+        # the statewide marker layer is serialized once and shared by every selection,
+        # the selected dispensary is left off it in the browser
+        state_payload = cached_markerPayload(dispensary_info, "dispensary_info.csv",
+                                             key=tuple(dispensary_info['global_id']))
+        m = dispensary_map(dispensary_selected, company, state_payload, zoom_start=10, skip=company_id)
         folium_static(m)
+        stage("map")
         ### resampling dictionary ###
         resample_dict = {'Daily': 'D', 'Weekly': 'W', 'Monthly': 'M', 'Quarterly': 'Q',
                          'Yearly': 'Y'}
         st.header("Sales Data Summary for {}".format(company.rstrip()))
         tp_selection = st.selectbox("Select Time Period Sampling", list(resample_dict.keys()))
+        total_index = get_rangeIndex('total')
+        min_date, max_date = date_range_picker(total_index.dates[0], total_index.dates[-1])
         ######################################################################################
-        query_string = "`" + str(company_id) + "` > 0"
-        ### dispensary of interest, need to get the rest of them ###
-        medicalSales = medicalSales_df.query(query_string)[str(company_id)].resample(resample_dict[tp_selection]).sum().to_frame()
-        s2_data      = medicalSales_df.query(query_string)[list(dispensaries_other['global_id'])].resample(resample_dict[tp_selection]).sum()
-        recreationalSales = recreationalSales_df.query(query_string)[str(company_id)].resample(resample_dict[tp_selection]).sum().to_frame()
-        s3_data      = recreationalSales_df.query(query_string)[list(dispensaries_other['global_id'])].resample(resample_dict[tp_selection]).sum()
-        totalSales   = totalSales_df.query(query_string)[str(company_id)].resample(resample_dict[tp_selection]).sum().to_frame()
-        s1_data      = totalSales_df.query(query_string)[list(dispensaries_other['global_id'])].resample(resample_dict[tp_selection]).sum()
-        min_date = pd.to_datetime(totalSales.index.values.min())
-        max_date = pd.to_datetime(totalSales.index.values.max())
+        ### dispensary of interest, the rest of the state comes from the peer tables ###
+        medicalSales = dispensary_rollup('medical', tp_selection, company_id, min_date, max_date)
+        recreationalSales = dispensary_rollup('recreational', tp_selection, company_id, min_date, max_date)
+        totalSales   = dispensary_rollup('total', tp_selection, company_id, min_date, max_date)
+        # totals of every dispensary over the selected dates from the prefix-sum index
+        state_table = total_index.table(min_date, max_date, companies)
         num_dispensaries = dispensary_info.shape[0]
         st.write("Total Sales for {0} Between {1} and {2}: ${3:,.2f}".format(company,
                                                                              min_date.date(),
                                                                              max_date.date(),
-                                                                             totalSales.sum()[0]))
-        average_totalSales = totalSales_df[list(dispensaries_other["global_id"])].sum().mean()
+                                                                             state_table.loc[company_id, 'total']))
+        average_totalSales = (state_table['total'].sum() - state_table.loc[company_id, 'total']) / (len(state_table) - 1)
         st.write("Average Total Sales for the {0} Other Dispensaries in {1}: ${2:,.2f}".format(num_dispensaries-1,
                                                                                                city,
                                                                                                average_totalSales))
-        totalSales_percentDiff = ((totalSales.sum()[0] - average_totalSales) / average_totalSales) * 100
+        totalSales_percentDiff = state_table.loc[company_id, 'total_pct_diff']
         if totalSales_percentDiff >= 0:
             st.write("{0} ({1}) performed {2:.2f}% better compared to the average total sales of the other dispensaries in {3}.".format(company,
                                                                                                                                         company_id,
@@ -254,40 +273,42 @@ def company_comparison():
                                                                                                                                            company_id,
                                                                                                                                            -1*totalSales_percentDiff,
                                                                                                                                            city))        
-        st.write("${:,.2f}".format(s1_data.mean().mean()))
+        st.write("Statewide percentile rank of {0} ({1}): {2:.0f} for total sales, {3:.0f} for average daily sales.".format(company,
+                                                                                                                        company_id,
+                                                                                                                        state_table.loc[company_id, 'total_percentile'],
+                                                                                                                        state_table.loc[company_id, 'average_percentile']))
+        s1_peerMean = peer_rollup('total', tp_selection, company_id, min_date, max_date)
+        st.write("${:,.2f}".format(s1_peerMean.mean()))
         st.write("${:,.2f}".format(totalSales.mean().mean()))
+        stage("summary")
         #st.table(s1_data.mean(axis=1))
         #st.table(totalSales)
         
-        s1_allData = pd.concat([totalSales, s1_data.mean(axis=1)], axis=1)
+        s1_allData = pd.concat([totalSales, s1_peerMean.rename(0)], axis=1)
         s1_allData.rename(columns = {0: 'All Other Dispensaries'}, inplace=True)
         #st.table(s1_allData)
-        s1 = px.line(s1_allData, x=s1_allData.index, y=s1_allData.columns,
-                     title = "{0} Sales (Medical and Recreational) Comparison".format(tp_selection))
-        s1.update_xaxes(title="Company Global Id")
-        s1.update_yaxes(title="Average {} Sales (Medical and Recreational), USD".format(tp_selection)) 
-        s1.update_traces(mode="markers+lines")
+        chart_key = ('state', company_id, tp_selection, min_date, max_date)
+        s1 = cached_figure(('total',) + chart_key, rollup_source('total', tp_selection),
+                           lambda: line_figure(s1_allData, "{0} Sales (Medical and Recreational) Comparison".format(tp_selection),
+                                               "Company Global Id", "Average {} Sales (Medical and Recreational), USD".format(tp_selection)))
         st.plotly_chart(s1)
 
-        s2_allData = pd.concat([medicalSales, s2_data.mean(axis=1)], axis=1)
+        s2_allData = pd.concat([medicalSales, peer_rollup('medical', tp_selection, company_id, min_date, max_date).rename(0)], axis=1)
         s2_allData.rename(columns = {0: 'All Other Dispensaries'}, inplace=True)
-        s2 = px.line(s2_allData, x=s2_allData.index, y=s2_allData.columns,
-                     title = "{0} Medical Sales Comparison".format(tp_selection))
-        s2.update_xaxes(title="Company Global Id")
-        s2.update_yaxes(title="Average {} Medical Sales, USD".format(tp_selection)) 
-        s2.update_traces(mode="markers+lines")
+        s2 = cached_figure(('medical',) + chart_key, rollup_source('medical', tp_selection),
+                           lambda: line_figure(s2_allData, "{0} Medical Sales Comparison".format(tp_selection),
+                                               "Company Global Id", "Average {} Medical Sales, USD".format(tp_selection)))
         st.plotly_chart(s2)
 
-        s3_allData = pd.concat([recreationalSales, s3_data.mean(axis=1)], axis=1)
+        s3_allData = pd.concat([recreationalSales, peer_rollup('recreational', tp_selection, company_id, min_date, max_date).rename(0)], axis=1)
         s3_allData.rename(columns = {0: 'All Other Dispensaries'}, inplace=True)
-        s3 = px.line(s3_allData, x=s3_allData.index, y=s3_allData.columns,
-                     title = "{0} Recreational Sales Comparison".format(tp_selection))
-        s3.update_xaxes(title="Company Global Id")
-        s3.update_yaxes(title="Average {} Recreational Sales, USD".format(tp_selection)) 
-        s3.update_traces(mode="markers+lines")
+        s3 = cached_figure(('recreational',) + chart_key, rollup_source('recreational', tp_selection),
+                           lambda: line_figure(s3_allData, "{0} Recreational Sales Comparison".format(tp_selection),
+                                               "Company Global Id", "Average {} Recreational Sales, USD".format(tp_selection)))
         st.plotly_chart(s3)
+        stage("charts")
         
-    else:
+    elif scope == 'Local (Same City)':
         num_dispensaries = len(list(license_df[license_df['city'] == city]["name"]))
         if num_dispensaries == 1:
             st.write("There is only {} dispensary in this town that is presently in the database.  Please set comparison to Statewide.".format(num_dispensaries))
@@ -302,80 +323,165 @@ def company_comparison():
             dispensaries_other = dispensaries_local[dispensaries_local["global_id"] != company_id]
 
             st.table(dispensary_info[dispensary_info['city'] == city])
-            
-            st.write('The selected dispensary for comparison is shown on the map with a blue marker.  All other dispensaries are shown on the map with red markers.')
-            
-            selected_dispo = dispensary_info[dispensary_info['global_id'] == company_id]
-            # initialize folium map, center on dispensary selected
-            m = folium.Map(location=[selected_dispo['Lat'], selected_dispo['Lon']], zoom_start=12)
-            tooltip = company
-            # place chosen dispensary on map with a marker
-            folium.Marker([selected_dispo['Lat'], selected_dispo['Lon']], popup=company, tooltip=tooltip).add_to(m)
-            # place markers for the other dispensaries in the same town, using different marker to distinguish
-            other_map_df = dispensaries_other[dispensaries_other['global_id'] != company_id]
-            for i in range(len(other_map_df)):
-                folium.Marker(
-                    location = [other_map_df.iloc[i]['Lat'], other_map_df.iloc[i]['Lon']],
-                    popup=other_map_df.iloc[i]['name'],
-                    icon=folium.Icon(color="red")
-                    ).add_to(m)
-            folium_static(m)
-            ### resampling dictionary ###
-            resample_dict = {'Daily': 'D', 'Weekly': 'W', 'Monthly': 'M', 'Quarterly': 'Q',
-                     'Yearly': 'Y'}
-            st.header("Sales Data Summary for {}".format(company.rstrip()))
-            tp_selection = st.selectbox("Select Time Period Sampling", list(resample_dict.keys()))
-            ######################################################################################
-            query_string = "`" + str(company_id) + "` > 0"
-            ### dispensary of interest, need to get the rest of them ###
-            medicalSales = medicalSales_df.query(query_string)[str(company_id)].resample(resample_dict[tp_selection]).sum().to_frame()
-            s2_data      = medicalSales_df.query(query_string)[list(dispensaries_other['global_id'])].resample(resample_dict[tp_selection]).sum()
-            recreationalSales = recreationalSales_df.query(query_string)[str(company_id)].resample(resample_dict[tp_selection]).sum().to_frame()
-            s3_data      = recreationalSales_df.query(query_string)[list(dispensaries_other['global_id'])].resample(resample_dict[tp_selection]).sum()
-            totalSales   = totalSales_df.query(query_string)[str(company_id)].resample(resample_dict[tp_selection]).sum().to_frame()
-            s1_data      = totalSales_df.query(query_string)[list(dispensaries_other['global_id'])].resample(resample_dict[tp_selection]).sum()
-            min_date = pd.to_datetime(totalSales.index.values.min())
-            max_date = pd.to_datetime(totalSales.index.values.max())
-            st.write("Total Sales for {0} Between {1} and {2}: ${3:,.2f}".format(company,
-                                                                                 min_date.date(),
-                                                                                 max_date.date(),
-                                                                                 totalSales.sum()[0]))
-            average_totalSales = totalSales_df[list(dispensaries_other["global_id"])].sum().mean()
-            st.write("Average Total Sales for the {0} Other Dispensaries in {1}: ${2:,.2f}".format(num_dispensaries-1,
-                                                                                                   city,
-                                                                                                   average_totalSales))
-            totalSales_percentDiff = ((totalSales.sum()[0] - average_totalSales) / average_totalSales) * 100
-            if totalSales_percentDiff >= 0:
-                st.write("{0} ({1}) performed {2:.2f}% better compared to the average total sales of the other dispensaries in {3}.".format(company,
-                                                                                                                                            company_id,
-                                                                                                                                            totalSales_percentDiff,
-                                                                                                                                            city))
+            peer_group_comparison(company, company_id, dispensary_info, dispensaries_other, city, zoom_start=12)
+
+    else:
+        radius = st.slider("Comparison Radius (Miles)", min_value=1, max_value=100, value=10)
+        dispensary_info = dispensary_info[dispensary_info["global_id"].isin(companies)]
+        selected_dispo = dispensary_info[dispensary_info['global_id'] == company_id]
+        if selected_dispo[['Lat', 'Lon']].isna().any(axis=None):
+            st.write("{0} ({1}) does not have a geocoded location yet.  Please set comparison to Statewide or Local (Same City).".format(company, company_id))
+        else:
+            # radius query against the spatial index instead of scanning the table
+            nearby_ids, nearby_distances = get_dispensaryIndex().within(selected_dispo['Lat'].iloc[0],
+                                                                         selected_dispo['Lon'].iloc[0],
+                                                                         radius)
+            distances = dict(zip(nearby_ids, nearby_distances))
+            dispensaries_other = dispensary_info[dispensary_info['global_id'].isin(list(distances)) &
+                                                 (dispensary_info['global_id'] != company_id)]
+            if len(dispensaries_other) == 0:
+                st.write("There are no other dispensaries within {0} miles of {1} that are presently in the database.  Please increase the radius or set comparison to Statewide.".format(radius, company))
             else:
-                st.write("{0} ({1}) performed {2:.2f}% worse compared to the average total sales of the other dispensaries in {3}.".format(company,
-                                                                                                                                           company_id,
-                                                                                                                                           -1*totalSales_percentDiff,
-                                                                                                                                           city))                
-            #st.table(totalSales.mean())
-            #st.table(s1_data.mean())
+                st.write("There are {0} other dispensaries within {1} miles of {2} that are presently in the database.".format(len(dispensaries_other), radius, company))
+                st.write("Comparison of {0} ({1}) Performance Against All Other Dispensaries Within {2} Miles".format(company, company_id, radius))
+                st.subheader("Locations of Dispensaries Within {} Miles".format(radius))
+                nearby_table = dispensaries_other.assign(**{'Distance (Miles)': dispensaries_other['global_id'].map(distances)})
+                st.table(nearby_table.sort_values('Distance (Miles)'))
+                zoom_start = 12 if radius <= 5 else 10 if radius <= 25 else 8
+                peer_group_comparison(company, company_id, dispensary_info, dispensaries_other,
+                                      "a {} Mile Radius".format(radius), zoom_start=zoom_start)
+
+
+def peer_group_comparison(company, company_id, dispensary_info, dispensaries_other, area, zoom_start=12):
+    """Map, summary and charts comparing one dispensary against a group of peers.
+    Parameters
+    ----------
+    dispensary_info:
+        geocoded dispensaries, including the selected one.
+    dispensaries_other:
+        rows of dispensary_info that make up the peer group.
+    area:
+        description of the peer group used in the text, e.g. the city.
+    """
+    import pandas as pd
+    import plotly.express as px
+    from streamlit_folium import folium_static
+    from sales_store import get_salesColumns
+    from map_layers import dispensary_map, marker_payload
+    from sales_ranges import dispensary_rollup, get_rangeIndex
+    # only the selected dispensary and its peers are read from the sales tables
+    local_ids = [company_id] + list(dispensaries_other['global_id'])
+    totalSales_df = get_salesColumns("total_sales.csv", local_ids)
+    recreationalSales_df = get_salesColumns("recreational_sales.csv", local_ids)
+    medicalSales_df = get_salesColumns("medical_sales.csv", local_ids)
+    stage("load peers")
+    
+    st.write('The selected dispensary for comparison is shown on the map with a blue marker.  All other dispensaries are shown on the map with red markers.')
+    
+    selected_dispo = dispensary_info[dispensary_info['global_id'] == company_id]
+    # place markers for the other dispensaries in the peer group as one layer
+    m = dispensary_map(selected_dispo, company, marker_payload(dispensaries_other),
+                       zoom_start=zoom_start, cluster=False)
+    folium_static(m)
+    stage("map")
+    ### resampling dictionary ###
+    resample_dict = {'Daily': 'D', 'Weekly': 'W', 'Monthly': 'M', 'Quarterly': 'Q',
+             'Yearly': 'Y'}
+    st.header("Sales Data Summary for {}".format(company.rstrip()))
+    tp_selection = st.selectbox("Select Time Period Sampling", list(resample_dict.keys()))
+    total_index = get_rangeIndex('total')
+    min_date, max_date = date_range_picker(total_index.dates[0], total_index.dates[-1])
+    ######################################################################################
+    query_string = "`" + str(company_id) + "` > 0"
+    ### dispensary of interest, need to get the rest of them ###
+    medicalSales = dispensary_rollup('medical', tp_selection, company_id, min_date, max_date)
+    s2_data      = medicalSales_df.loc[min_date:max_date].query(query_string)[list(dispensaries_other['global_id'])].resample(resample_dict[tp_selection]).sum()
+    recreationalSales = dispensary_rollup('recreational', tp_selection, company_id, min_date, max_date)
+    s3_data      = recreationalSales_df.loc[min_date:max_date].query(query_string)[list(dispensaries_other['global_id'])].resample(resample_dict[tp_selection]).sum()
+    totalSales   = dispensary_rollup('total', tp_selection, company_id, min_date, max_date)
+    s1_data      = totalSales_df.loc[min_date:max_date].query(query_string)[list(dispensaries_other['global_id'])].resample(resample_dict[tp_selection]).sum()
+    local_totals = total_index.totals(min_date, max_date, local_ids)
+    st.write("Total Sales for {0} Between {1} and {2}: ${3:,.2f}".format(company,
+                                                                         min_date.date(),
+                                                                         max_date.date(),
+                                                                         local_totals[company_id]))
+    average_totalSales = local_totals[list(dispensaries_other["global_id"])].mean()
+    st.write("Average Total Sales for the {0} Other Dispensaries in {1}: ${2:,.2f}".format(len(dispensaries_other),
+                                                                                           area,
+                                                                                           average_totalSales))
+    totalSales_percentDiff = ((local_totals[company_id] - average_totalSales) / average_totalSales) * 100
+    if totalSales_percentDiff >= 0:
+        st.write("{0} ({1}) performed {2:.2f}% better compared to the average total sales of the other dispensaries in {3}.".format(company,
+                                                                                                                                    company_id,
+                                                                                                                                    totalSales_percentDiff,
+                                                                                                                                    area))
+    else:
+        st.write("{0} ({1}) performed {2:.2f}% worse compared to the average total sales of the other dispensaries in {3}.".format(company,
+                                                                                                                                   company_id,
+                                                                                                                                   -1*totalSales_percentDiff,
+                                                                                                                                   area))                
+    stage("summary")
+    #st.table(totalSales.mean())
+    #st.table(s1_data.mean())
+
+    s1_allData = pd.concat([totalSales, s1_data], axis=0) 
+    s1 = px.bar(s1_allData.mean(), x=s1_allData.mean().index, y=0, color=0,
+                title = "{0} Sales (Medical and Recreational) Comparison".format(tp_selection))
+    s1.update_xaxes(title="Company Global Id")
+    s1.update_yaxes(title="Average {} Sales (Medical and Recreational), USD".format(tp_selection)) 
+    st.plotly_chart(s1)
+
+    s2_allData = pd.concat([medicalSales, s2_data], axis=0) 
+    s2 = px.bar(s2_allData.mean(), x=s2_allData.mean().index, y=0, color=0,
+                title = "{0} Medical Sales Comparison".format(tp_selection))
+    s2.update_xaxes(title="Company Global Id")
+    s2.update_yaxes(title="Average {} Medical Sales, USD".format(tp_selection)) 
+    st.plotly_chart(s2)
+
+    s3_allData = pd.concat([recreationalSales, s3_data], axis=0) 
+    s3 = px.bar(s3_allData.mean(), x=s3_allData.mean().index, y=0, color=0,
+                title = "{0} Recreational Sales Comparison".format(tp_selection))
+    s3.update_xaxes(title="Company Global Id")
+    s3.update_yaxes(title="Average {} Recreational Sales, USD".format(tp_selection)) 
+    st.plotly_chart(s3, width = 200)
+    stage("charts")
+
 
-            s1_allData = pd.concat([totalSales, s1_data], axis=0) 
-            s1 = px.bar(s1_allData.mean(), x=s1_allData.mean().index, y=0, color=0,
-                        title = "{0} Sales (Medical and Recreational) Comparison".format(tp_selection))
-            s1.update_xaxes(title="Company Global Id")
-            s1.update_yaxes(title="Average {} Sales (Medical and Recreational), USD".format(tp_selection)) 
-            st.plotly_chart(s1)
+def date_range_picker(first_date, last_date):
+    """Slider for a date range between first_date and last_date, both included.
+    Returns the selected (start, end) as Timestamps.
+    """
+    import pandas as pd
+    first_date, last_date = pd.Timestamp(first_date), pd.Timestamp(last_date)
+    if pd.isna(first_date) or first_date >= last_date:
+        return first_date, last_date
+    start, end = st.slider("Select Date Range", min_value=first_date.date(), max_value=last_date.date(),
+                           value=(first_date.date(), last_date.date()))
+    return pd.Timestamp(start), pd.Timestamp(end)
 
-            s2_allData = pd.concat([medicalSales, s2_data], axis=0) 
-            s2 = px.bar(s2_allData.mean(), x=s2_allData.mean().index, y=0, color=0,
-                        title = "{0} Medical Sales Comparison".format(tp_selection))
-            s2.update_xaxes(title="Company Global Id")
-            s2.update_yaxes(title="Average {} Medical Sales, USD".format(tp_selection)) 
-            st.plotly_chart(s2)
 
-            s3_allData = pd.concat([recreationalSales, s3_data], axis=0) 
-            s3 = px.bar(s3_allData.mean(), x=s3_allData.mean().index, y=0, color=0,
-                        title = "{0} Recreational Sales Comparison".format(tp_selection))
-            s3.update_xaxes(title="Company Global Id")
-            s3.update_yaxes(title="Average {} Recreational Sales, USD".format(tp_selection)) 
-            st.plotly_chart(s3, width = 200)
-            
\ No newline at end of file
+def warm_caches():
+    """Imports the page dependencies and loads the shared datasets, so the
+    first visit of each page does not pay for them.  Only touches the
+    thread-safe caches, it is run in a background thread by MultiApp.
+    """
+    import plotly.express
+    # folium without streamlit_folium, which registers its component through
+    # the script context that this thread does not have
+    import map_layers
+    from sales_data import get_licenseInfo, get_dispensaryInfo
+    from sales_store import get_salesCompanies
+    from sales_rollups import CHANNEL_FILES, RESAMPLE_RULES
+    from peer_comparison import peer_stats
+    from spatial_index import get_dispensaryIndex
+    from sales_ranges import get_rangeIndex
+    from sales_forecast import open_forecast
+    get_licenseInfo()
+    get_dispensaryInfo()
+    get_salesCompanies("total_sales.csv")
+    get_dispensaryIndex()
+    get_rangeIndex('total')
+    open_forecast('total')
+    for channel in CHANNEL_FILES:
+        for period in RESAMPLE_RULES:
+            peer_stats(channel, period)
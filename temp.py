@@ -9,18 +9,15 @@ This is a temporary script file.
 #my_dir = os.getcwd()
 #os.chdir(my_dir)
 #import sys
-import pandas as pd
-import numpy as np
 #import scipy.fft
-import streamlit as st
-import plotly.express as px
 from streamlit_multiApp import MultiApp
-from tdi_capstone_apps import *
 
 
 app = MultiApp()
 
-app.add_app("Homepage", homepage_app)
-app.add_app("Select Company", single_company_stats)
-app.add_app("Company Comparison", company_comparison)
+# pages are imported when first selected, see streamlit_multiApp.py
+app.add_app("Homepage", "tdi_capstone_apps:homepage_app")
+app.add_app("Select Company", "tdi_capstone_apps:single_company_stats")
+app.add_app("Company Comparison", "tdi_capstone_apps:company_comparison")
+app.add_warmup("tdi_capstone_apps:warm_caches")
 app.run()
\ No newline at end of file
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 21:14:05 2026
+
+@author: stark
+"""
+
+"""rollup_range against the prefix-sum index on ranges that cut through bins."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from sales_ranges import SalesRangeIndex, rollup_range
+from sales_rollups import RESAMPLE_RULES, resample_positive
+
+
+@pytest.fixture(scope='module')
+def daily():
+    rng = np.random.default_rng(0)
+    dates = pd.date_range('2018-11-20', '2020-08-14', freq='D', name='sold_at')
+    values = rng.normal(1000, 600, size=(len(dates), 3))
+    values[rng.random(values.shape) < 0.1] = np.nan
+    return pd.DataFrame(values, index=dates, columns=['A', 'B', 'C'])
+
+
+@pytest.mark.parametrize('period', list(RESAMPLE_RULES))
+@pytest.mark.parametrize('start, end', [('2019-03-03', '2019-05-10'),
+                                        ('2019-01-01', '2019-12-31'),
+                                        ('2019-02-14', '2020-02-14')])
+def test_clipped_range_matches_daily_total(daily, period, start, end):
+    index = SalesRangeIndex(daily)
+    rollup = resample_positive(daily[['A']], RESAMPLE_RULES[period])[0]
+
+    def partial(lo, hi):
+        return index.totals(lo, hi, ['A'])['A']
+
+    clipped = rollup_range(rollup, period, start, end, partial)
+    assert clipped['A'].sum() == pytest.approx(partial(start, end))
+    assert clipped.index[0] >= pd.Timestamp(start)
+    assert clipped.index[-1] >= pd.Timestamp(end)
+
+
+def test_inner_bins_are_left_alone(daily):
+    rollup = resample_positive(daily[['B']], 'M')[0]
+    clipped = rollup_range(rollup, 'Monthly', '2019-03-03', '2019-07-10',
+                           lambda lo, hi: -1.0)
+    assert list(clipped['B']) == [-1.0] + list(rollup.loc['2019-04-30':'2019-06-30', 'B']) + [-1.0]